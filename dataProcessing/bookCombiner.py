@@ -5,29 +5,145 @@
 将data文件夹下所有书籍的章节文件合并成一个大的文本文件
 """
 
+import codecs
 import os
 import glob
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def read_file_content(file_path):
+# charset-normalizer可用时用前4KB嗅探编码，一次解码到位；
+# 未安装则退回逐个编码试错
+try:
+    from charset_normalizer import from_bytes as _cn_from_bytes
+except ImportError:
+    _cn_from_bytes = None
+
+# 文件读取是I/O密集型操作，线程池规模以I/O并发为准
+MAX_READ_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# 输出文件写缓冲: 1MB大块写，减少write系统调用次数(默认只有8KB)
+WRITE_BUFFER_SIZE = 1 << 20
+
+# 支持的文件扩展名 (只取splitext出的后缀做小写和集合查找，
+# 避免对整个长文件名逐字符lower)
+TEXT_EXTENSIONS = frozenset({'.txt', '.md'})
+
+# 安全文件名过滤: 预编译正则一次，C层替换，
+# 等价于逐字符的isalnum()/' -_'判断 (\w在Unicode下含中英文和数字、下划线)
+_UNSAFE_CHARS = re.compile(r'[^\w \-]')
+
+# 预编码的分隔线字节常量: 输出端是二进制，
+# 不必为每个子库/书籍重新构造再编码同样的分隔线
+EQ_LINE = ("="*100 + "\n").encode('utf-8')
+DASH_LINE = ("-"*80 + "\n").encode('utf-8')
+
+def scandir_walk(path):
     """
-    安全读取文件内容，支持多种编码
+    用os.scandir递归遍历目录，等价于os.walk(自顶向下)
+    直接复用DirEntry缓存的元数据，省去每个条目额外的stat/lstat系统调用
     """
-    encodings = ['utf-8', 'gbk', 'gb2312', 'utf-8-sig']
-    
-    for encoding in encodings:
+    dirs = []
+    files = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry)
+                elif entry.is_file():
+                    files.append(entry)
+    except OSError as e:
+        print(f"遍历目录 {path} 时出错: {e}")
+        return
+
+    yield path, dirs, files
+
+    for dir_entry in dirs:
+        yield from scandir_walk(dir_entry.path)
+
+# 候选编码，按出现概率排列
+ENCODINGS = ['utf-8', 'gbk', 'gb2312', 'utf-8-sig']
+
+# 同一书籍目录下的文件几乎总是同一编码，按目录缓存上次成功的编码
+_enc_cache = {}
+
+def read_file_bytes(file_path):
+    """
+    安全读取文件内容，返回UTF-8编码的字节
+    只做一次二进制读取再尝试解码，避免解码失败时反复重新读盘；
+    成功的编码按目录缓存，后续文件优先尝试。
+    源文件本身是UTF-8时(含目录缓存确认的情况)直接原样返回字节，
+    跳过解码→再编码两次转换，输出端按二进制写即可
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+    except Exception as e:
+        print(f"读取文件 {file_path} 时出错: {e}")
+        return None
+
+    # UTF-8 BOM可以直接确定编码，去掉BOM后即为UTF-8字节
+    if data.startswith(b'\xef\xbb\xbf'):
+        return data[3:]
+
+    dir_path = os.path.dirname(file_path)
+    cached = _enc_cache.get(dir_path)
+
+    # 快路径: 目录编码已确认为UTF-8，校验一次后字节直接进入UTF-8
+    # 输出(仍省掉再编码)。校验不能省: 混合编码目录里第一个文件是
+    # UTF-8时，后续GBK文件的原始字节会原样写进输出，产出损坏的文件
+    candidates = None
+    if cached == 'utf-8':
+        try:
+            data.decode('utf-8')
+            return data
+        except UnicodeDecodeError:
+            # 缓存编码对这个文件不成立: 不再嗅探(小样本容易误判)，
+            # 直接把其余候选编码按原顺序试一遍
+            candidates = [enc for enc in ENCODINGS if enc != 'utf-8']
+    elif cached is not None:
+        candidates = [cached] + [enc for enc in ENCODINGS if enc != cached]
+
+    if candidates is None:
+        candidates = ENCODINGS
+        if _cn_from_bytes is not None:
+            # 目录还没有缓存时先嗅探前4KB，把命中的编码排到首位，
+            # 常见情况下第一次解码即成功。嗅探只用于重排既有候选:
+            # 清单外的猜测(如把GBK认成cp949)常常也能"成功"解码，
+            # 产出乱码，所以一律忽略
+            best = _cn_from_bytes(data[:4096]).best()
+            if best is not None and best.encoding:
+                try:
+                    guess = codecs.lookup(best.encoding).name
+                except LookupError:
+                    guess = None
+                if guess in ENCODINGS:
+                    candidates = [guess] + [enc for enc in ENCODINGS if enc != guess]
+
+    for encoding in candidates:
         try:
-            with open(file_path, 'r', encoding=encoding) as f:
-                return f.read()
+            content = data.decode(encoding)
         except UnicodeDecodeError:
             continue
-        except Exception as e:
-            print(f"读取文件 {file_path} 时出错: {e}")
-            return None
-    
+        _enc_cache[dir_path] = encoding
+        if encoding in ('utf-8', 'utf-8-sig'):
+            # 本来就是UTF-8字节，无需再编码
+            return data
+        return content.encode('utf-8')
+
     print(f"无法读取文件 {file_path}，所有编码都失败")
     return None
 
+def read_file_content(file_path):
+    """
+    安全读取文件内容，支持多种编码，返回str
+    """
+    data = read_file_bytes(file_path)
+    if data is None:
+        return None
+    return data.decode('utf-8')
+
 def combine_books_by_library(data_root="../data", output_dir="output"):
     """
     按库分别合并书籍章节，每个库生成一个文件
@@ -40,104 +156,164 @@ def combine_books_by_library(data_root="../data", output_dir="output"):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
-    # 支持的文件扩展名
-    text_extensions = ['.txt', '.md']
-    
     total_files = 0
     successful_files = 0
     libraries_processed = 0
-    
+
+    # 合并的同时顺带累计统计信息，目录树只需遍历一次
+    stats = {'books': 0, 'chapters': 0, 'total_size': 0}
+
     print("开始按库合并书籍章节...")
     
     # 遍历data下的每个库
-    for library_name in os.listdir(data_root):
-        library_path = os.path.join(data_root, library_name)
-        if not os.path.isdir(library_path):
+    for library_entry in os.scandir(data_root):
+        if not library_entry.is_dir(follow_symlinks=False):
             continue
-            
+        library_name = library_entry.name
+
         print(f"\n处理库: {library_name}")
         libraries_processed += 1
-        
+
         # 为每个库遍历其子目录
-        for sub_library in os.listdir(library_path):
-            sub_library_path = os.path.join(library_path, sub_library)
-            if not os.path.isdir(sub_library_path):
+        for sub_library_entry in os.scandir(library_entry.path):
+            if not sub_library_entry.is_dir(follow_symlinks=False):
                 continue
-                
-            print(f"  处理子库: {sub_library}")
-            
-            combined_content = []
-            library_files = 0
-            library_successful = 0
-            
-            # 添加库的标题
-            combined_content.append("="*100 + "\n")
-            combined_content.append(f"【{sub_library}】\n")
-            combined_content.append("="*100 + "\n\n")
-            
-            # 遍历子库下的所有书籍/方剂
-            for root, dirs, files in os.walk(sub_library_path):
+            sub_library = sub_library_entry.name
+            sub_library_path = sub_library_entry.path
+
+            # 每个子库的日志先攒在列表里，最后一次性写stdout，
+            # 避免逐条print在大语料上带来成千上万次格式化+写终端
+            log_batch = [f"  处理子库: {sub_library}"]
+
+            # 第一步: 枚举所有书籍及其章节文件 [(book_name, [(file, file_path), ...]), ...]
+            books = []
+            max_input_mtime = 0.0
+            for root, dirs, files in scandir_walk(sub_library_path):
                 # 跳过子库根目录
                 if root == sub_library_path:
                     continue
-                    
+
                 # 检查当前目录是否包含文本文件
                 text_files = []
-                for file in files:
-                    if any(file.lower().endswith(ext) for ext in text_extensions):
-                        text_files.append(file)
-                
+                for entry in files:
+                    if os.path.splitext(entry.name)[1].lower() in TEXT_EXTENSIONS:
+                        text_files.append(entry)
+
                 if text_files:
                     # 获取书籍/方剂名称
                     book_name = os.path.basename(root)
-                    
-                    # 添加书籍标题
-                    combined_content.append("\n" + "-"*80 + "\n")
-                    combined_content.append(f"【{book_name}】\n")
-                    combined_content.append("-"*80 + "\n\n")
-                    
-                    print(f"    处理书籍: {book_name}")
-                    
+
+                    log_batch.append(f"    处理书籍: {book_name}")
+
+                    # 统计信息与合并共用同一次遍历
+                    stats['books'] += 1
+                    stats['chapters'] += len(text_files)
+                    for entry in text_files:
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        stats['total_size'] += st.st_size
+                        if st.st_mtime > max_input_mtime:
+                            max_input_mtime = st.st_mtime
+
                     # 排序文件名，确保输出有序
-                    text_files.sort()
-                    
-                    for file in text_files:
-                        file_path = os.path.join(root, file)
-                        library_files += 1
-                        total_files += 1
-                        
-                        print(f"      处理文件: {file}")
-                        
-                        # 添加文件标题
-                        combined_content.append(f"\n*** {file} ***\n\n")
-                        
-                        # 读取文件内容
-                        content = read_file_content(file_path)
-                        if content is not None:
-                            combined_content.append(content)
-                            combined_content.append("\n\n")
-                            library_successful += 1
-                            successful_files += 1
-                        else:
-                            combined_content.append("[文件读取失败]\n\n")
-            
-            # 只有当有内容时才写入文件
-            if combined_content and library_files > 0:
-                # 生成安全的文件名
-                safe_filename = "".join(c for c in sub_library if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                output_filename = f"{safe_filename}.txt"
-                output_path = os.path.join(output_dir, output_filename)
-                
+                    text_files.sort(key=lambda e: e.name)
+
+                    books.append((book_name,
+                                  [(entry.name, entry.path) for entry in text_files]))
+
+            # 只有存在章节文件时才生成输出
+            if not books:
+                sys.stdout.write("\n".join(log_batch) + "\n")
+                continue
+
+            # scandir的目录顺序不保证稳定，书籍列表在这里整体排一次序，
+            # 保证多次运行输出完全一致 (章节在枚举时已按文件名排好)
+            books.sort(key=lambda item: item[0])
+
+            # 生成安全的文件名
+            safe_filename = _UNSAFE_CHARS.sub('', sub_library).rstrip()
+            output_filename = f"{safe_filename}.txt"
+            output_path = os.path.join(output_dir, output_filename)
+
+            # 输出文件比所有输入都新时，整个子库无需重读
+            try:
+                if os.path.getmtime(output_path) >= max_input_mtime:
+                    log_batch.append(f"    -> {output_filename} 已是最新，跳过")
+                    sys.stdout.write("\n".join(log_batch) + "\n")
+                    continue
+            except OSError:
+                pass  # 输出尚不存在，正常生成
+
+            library_files = 0
+            library_successful = 0
+
+            # 第二步: 线程池并发读取章节文件，边读边按枚举顺序流式写出
+            # 不再在内存里堆积全量内容，峰值内存只与单个文件相关
+            file_paths = [file_path
+                          for _, chapters in books
+                          for _, file_path in chapters]
+
+            # 先写临时文件、成功后os.replace原子落位: 半途失败的
+            # 残缺输出若直接占住output_path，其新鲜mtime会让后续
+            # 运行一直走"已是最新"短路，截断内容永远不被重建
+            tmp_path = output_path + '.tmp'
+
+            try:
+                # 输出按二进制写: 读取端返回的UTF-8字节可以原样落盘
+                with ThreadPoolExecutor(max_workers=MAX_READ_WORKERS) as executor, \
+                        open(tmp_path, 'wb',
+                             buffering=WRITE_BUFFER_SIZE) as out:
+                    content_iter = executor.map(read_file_bytes, file_paths)
+
+                    # 添加库的标题
+                    out.write(EQ_LINE)
+                    out.write(f"【{sub_library}】\n".encode('utf-8'))
+                    out.write(EQ_LINE)
+                    out.write(b"\n")
+
+                    for book_name, chapters in books:
+                        # 添加书籍标题
+                        out.write(b"\n")
+                        out.write(DASH_LINE)
+                        out.write(f"【{book_name}】\n".encode('utf-8'))
+                        out.write(DASH_LINE)
+                        out.write(b"\n")
+
+                        for file, file_path in chapters:
+                            library_files += 1
+                            total_files += 1
+
+                            # 添加文件标题
+                            out.write(f"\n*** {file} ***\n\n".encode('utf-8'))
+
+                            # 读取文件内容
+                            content = next(content_iter)
+                            if content is not None:
+                                out.write(content)
+                                out.write(b"\n\n")
+                                library_successful += 1
+                                successful_files += 1
+                            else:
+                                out.write("[文件读取失败]\n\n".encode('utf-8'))
+
+                os.replace(tmp_path, output_path)
+
+                log_batch.append(f"    -> 生成文件: {output_filename}")
+                log_batch.append(f"       包含 {library_files} 个章节文件")
+                log_batch.append(f"       文件大小: {os.path.getsize(output_path) / 1024:.2f} KB")
+
+            except Exception as e:
+                # 清掉半成品，下次运行正常重建
                 try:
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        f.write(''.join(combined_content))
-                    
-                    print(f"    -> 生成文件: {output_filename}")
-                    print(f"       包含 {library_files} 个章节文件")
-                    print(f"       文件大小: {os.path.getsize(output_path) / 1024:.2f} KB")
-                    
-                except Exception as e:
-                    print(f"    写入文件 {output_filename} 时出错: {e}")
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                log_batch.append(f"    写入文件 {output_filename} 时出错: {e}")
+
+            # 每个子库只做一次stdout写出
+            sys.stdout.write("\n".join(log_batch) + "\n")
     
     print(f"\n" + "="*50)
     print(f"合并完成！")
@@ -146,6 +322,12 @@ def combine_books_by_library(data_root="../data", output_dir="output"):
     print(f"成功处理: {successful_files}")
     print(f"输出目录: {output_dir}")
 
+    print(f"\n总统计:")
+    print(f"库的数量: {libraries_processed}")
+    print(f"书籍/方剂总数: {stats['books']}")
+    print(f"章节文件总数: {stats['chapters']}")
+    print(f"总文件大小: {stats['total_size'] / 1024 / 1024:.2f} MB")
+
 def combine_books(data_root="../data", output_file="combined_books.txt"):
     """
     合并所有书籍章节到一个文件 (保留原函数)
@@ -154,71 +336,67 @@ def combine_books(data_root="../data", output_file="combined_books.txt"):
         print(f"数据文件夹 {data_root} 不存在")
         return
     
-    # 支持的文件扩展名
-    text_extensions = ['.txt', '.md']
-    
-    combined_content = []
     total_files = 0
     successful_files = 0
-    
+
     print("开始合并书籍章节...")
-    
-    # 遍历data文件夹下的所有内容
-    for root, dirs, files in os.walk(data_root):
-        # 跳过根目录
-        if root == data_root:
-            continue
-            
-        # 检查当前目录是否包含文本文件
-        text_files = []
-        for file in files:
-            if any(file.lower().endswith(ext) for ext in text_extensions):
-                text_files.append(file)
-        
-        if text_files:
-            # 获取相对路径作为标识
-            relative_path = os.path.relpath(root, data_root)
-            path_parts = relative_path.split(os.sep)
-            
-            # 添加目录信息作为章节标题
-            combined_content.append("\n" + "="*80 + "\n")
-            combined_content.append(f"【{' > '.join(path_parts)}】\n")
-            combined_content.append("="*80 + "\n\n")
-            
-            print(f"处理目录: {relative_path}")
-            
-            # 排序文件名，确保输出有序
-            text_files.sort()
-            
-            for file in text_files:
-                file_path = os.path.join(root, file)
-                total_files += 1
-                
-                print(f"  处理文件: {file}")
-                
-                # 添加文件标题
-                combined_content.append(f"\n--- {file} ---\n\n")
-                
-                # 读取文件内容
-                content = read_file_content(file_path)
-                if content is not None:
-                    combined_content.append(content)
-                    combined_content.append("\n\n")
-                    successful_files += 1
-                else:
-                    combined_content.append("[文件读取失败]\n\n")
-    
-    # 写入合并后的文件
+
+    # 边遍历边流式写出，避免在内存里堆积全量内容
     try:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(''.join(combined_content))
-        
+        with open(output_file, 'w', encoding='utf-8',
+                  buffering=WRITE_BUFFER_SIZE) as out:
+            # 遍历data文件夹下的所有内容
+            for root, dirs, files in scandir_walk(data_root):
+                # 跳过根目录
+                if root == data_root:
+                    continue
+
+                # 检查当前目录是否包含文本文件
+                text_files = []
+                for entry in files:
+                    if os.path.splitext(entry.name)[1].lower() in TEXT_EXTENSIONS:
+                        text_files.append(entry)
+
+                if text_files:
+                    # 获取相对路径作为标识
+                    relative_path = os.path.relpath(root, data_root)
+                    path_parts = relative_path.split(os.sep)
+
+                    # 添加目录信息作为章节标题
+                    out.write("\n" + "="*80 + "\n")
+                    out.write(f"【{' > '.join(path_parts)}】\n")
+                    out.write("="*80 + "\n\n")
+
+                    print(f"处理目录: {relative_path}")
+
+                    # 排序文件名，确保输出有序
+                    text_files.sort(key=lambda e: e.name)
+
+                    for entry in text_files:
+                        # DirEntry.path已是拼接好的完整路径，省去os.path.join
+                        file_path = entry.path
+                        total_files += 1
+
+                        print(f"  处理文件: {entry.name}")
+
+                        # 添加文件标题
+                        out.write(f"\n--- {entry.name} ---\n\n")
+
+                        # 读取文件内容
+                        content = read_file_content(file_path)
+                        if content is not None:
+                            out.write(content)
+                            out.write("\n\n")
+                            successful_files += 1
+                        else:
+                            out.write("[文件读取失败]\n\n")
+
         print(f"\n合并完成！")
         print(f"总文件数: {total_files}")
         print(f"成功处理: {successful_files}")
         print(f"输出文件: {output_file}")
         print(f"文件大小: {os.path.getsize(output_file) / 1024 / 1024:.2f} MB")
-        
+
     except Exception as e:
         print(f"写入输出文件时出错: {e}")
 
@@ -230,7 +408,6 @@ def get_statistics(data_root="data"):
         print(f"数据文件夹 {data_root} 不存在")
         return
     
-    text_extensions = ['.txt', '.md']
     stats = {
         'libraries': 0,
         'books': 0,
@@ -240,31 +417,31 @@ def get_statistics(data_root="data"):
     
     print("数据统计:")
     
-    for item in os.listdir(data_root):
-        item_path = os.path.join(data_root, item)
-        if os.path.isdir(item_path):
-            print(f"\n库: {item}")
-            
+    for item_entry in os.scandir(data_root):
+        if item_entry.is_dir(follow_symlinks=False):
+            item_path = item_entry.path
+            print(f"\n库: {item_entry.name}")
+
             library_books = 0
             library_chapters = 0
-            
-            for root, dirs, files in os.walk(item_path):
+
+            for root, dirs, files in scandir_walk(item_path):
                 if root == item_path:
                     continue
-                    
+
                 # 检查是否包含文本文件
-                text_files = [f for f in files if any(f.lower().endswith(ext) for ext in text_extensions)]
+                text_files = [e for e in files if os.path.splitext(e.name)[1].lower() in TEXT_EXTENSIONS]
                 if text_files:
                     library_books += 1
                     library_chapters += len(text_files)
-                    
-                    # 计算文件大小
-                    for file in text_files:
-                        file_path = os.path.join(root, file)
+
+                    # 计算文件大小 (DirEntry已缓存stat结果)
+                    for entry in text_files:
                         try:
-                            stats['total_size'] += os.path.getsize(file_path)
-                        except:
-                            pass
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        stats['total_size'] += st.st_size
             
             print(f"  书籍/方剂数: {library_books}")
             print(f"  章节文件数: {library_chapters}")
@@ -280,10 +457,5 @@ def get_statistics(data_root="data"):
     print(f"总文件大小: {stats['total_size'] / 1024 / 1024:.2f} MB")
 
 if __name__ == "__main__":
-    # 首先显示统计信息
-    get_statistics()
-    
-    print("\n" + "="*50)
-    
-    # 按库分别合并书籍
+    # 按库分别合并书籍，统计信息在同一次遍历中收集并随后打印
     combine_books_by_library()
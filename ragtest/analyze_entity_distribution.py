@@ -3,70 +3,83 @@
 分析实体类型分布
 """
 
+# 顶层导入: 缺依赖时直接报错并给出安装指引，
+# 不在每次运行的分析路径里做导入兜底
+try:
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+except ImportError as e:
+    raise SystemExit(f"❌ 需要安装pyarrow: pip install pyarrow ({e})")
+
 try:
-    import pandas as pd
-    import numpy as np
-    
     # 尝试不同的文件名
     possible_files = [
         './output2/entities.parquet',
         './output2/entities.parquet'
     ]
-    
-    df = None
-    for file_path in possible_files:
+
+    type_column = None
+    # 去重候选路径，避免对同一文件重复读取
+    for file_path in dict.fromkeys(possible_files):
         try:
-            df = pd.read_parquet(file_path)
+            # 只读type列，parquet是列存格式，
+            # 聚合直接在Arrow缓冲上进行，省掉pandas的封装开销；
+            # dataset接口按row group并行解压，大文件随核数加速
+            dataset = ds.dataset(file_path, format='parquet')
+            type_column = dataset.to_table(columns=['type'], use_threads=True).column('type')
             print(f"✅ 成功读取: {file_path}")
             break
         except Exception as e:
             print(f"❌ 无法读取 {file_path}: {e}")
-    
-    if df is None:
+
+    if type_column is None:
         print("❌ 无法读取实体文件")
         exit(1)
-    
+
+    total = len(type_column)
+
     print(f"\n📊 实体数据统计:")
     print("="*50)
-    print(f"总实体数: {len(df):,}")
-    
-    if 'type' in df.columns:
-        print(f"\n🏷️ 实体类型分布:")
-        print("-" * 30)
-        
-        type_counts = df['type'].value_counts()
-        total = len(df)
-        
-        for entity_type, count in type_counts.head(20).items():
-            percentage = count / total * 100
-            if entity_type == '':
-                print(f"{'[空类型]':<15}: {count:>6,} ({percentage:>5.1f}%)")
-            else:
-                print(f"{entity_type:<15}: {count:>6,} ({percentage:>5.1f}%)")
-        
-        # 统计问题实体
-        empty_count = len(df[df['type'] == ''])
-        predefined_types = ['药材','方剂','疾病','症状','医家','功效','病因','脉象','诊断方法','经络','穴位','脏腑']
-        predefined_count = len(df[df['type'].isin(predefined_types)])
-        other_count = total - empty_count - predefined_count
-        
-        print(f"\n📈 分类统计:")
+    print(f"总实体数: {total:,}")
+
+    # 一次value_counts内核得到全部类型计数，
+    # 后续所有统计都从这个小结果推导，不再扫描原始列
+    type_counts = pc.value_counts(type_column.combine_chunks()).to_pylist()
+    # NaN/NULL单独成项，与原pandas行为一致地从分布展示中剔除
+    type_counts = [item for item in type_counts if item['values'] is not None]
+    type_counts.sort(key=lambda item: item['counts'], reverse=True)
+
+    print(f"\n🏷️ 实体类型分布:")
+    print("-" * 30)
+
+    for item in type_counts[:20]:
+        entity_type = item['values']
+        count = item['counts']
+        percentage = count / total * 100
+        if entity_type == '':
+            print(f"{'[空类型]':<15}: {count:>6,} ({percentage:>5.1f}%)")
+        else:
+            print(f"{entity_type:<15}: {count:>6,} ({percentage:>5.1f}%)")
+
+    # 统计问题实体
+    predefined_types = frozenset({'药材','方剂','疾病','症状','医家','功效','病因','脉象','诊断方法','经络','穴位','脏腑'})
+    empty_count = sum(item['counts'] for item in type_counts if item['values'] == '')
+    predefined_count = sum(item['counts'] for item in type_counts if item['values'] in predefined_types)
+    other_count = total - empty_count - predefined_count
+
+    print(f"\n📈 分类统计:")
+    print("-" * 30)
+    print(f"预定义类型实体: {predefined_count:,} ({predefined_count/total*100:.1f}%)")
+    print(f"其他类型实体:   {other_count:,} ({other_count/total*100:.1f}%)")
+    print(f"空类型实体:     {empty_count:,} ({empty_count/total*100:.1f}%)")
+
+    if other_count > 0:
+        print(f"\n🔍 非预定义类型:")
         print("-" * 30)
-        print(f"预定义类型实体: {predefined_count:,} ({predefined_count/total*100:.1f}%)")
-        print(f"其他类型实体:   {other_count:,} ({other_count/total*100:.1f}%)")
-        print(f"空类型实体:     {empty_count:,} ({empty_count/total*100:.1f}%)")
-        
-        if other_count > 0:
-            print(f"\n🔍 非预定义类型:")
-            print("-" * 30)
-            other_types = df[~df['type'].isin(predefined_types + [''])]['type'].value_counts()
-            for otype, count in other_types.head(10).items():
-                print(f"{otype:<15}: {count:>6,}")
-                
-    else:
-        print("❌ 没有找到type列")
-        
-except ImportError:
-    print("❌ 需要安装pandas: pip install pandas")
+        other_types = [item for item in type_counts
+                       if item['values'] != '' and item['values'] not in predefined_types]
+        for item in other_types[:10]:
+            print(f"{item['values']:<15}: {item['counts']:>6,}")
+
 except Exception as e:
-    print(f"❌ 分析失败: {e}")
\ No newline at end of file
+    print(f"❌ 分析失败: {e}")
@@ -3,301 +3,350 @@
 分析Neo4j数据库中的数据分布
 """
 
-from neo4j import GraphDatabase
+import asyncio
+
+from neo4j import AsyncGraphDatabase
 import pandas as pd
-from collections import defaultdict
 
 class Neo4jAnalyzer:
     def __init__(self, uri="bolt://localhost:7687", user="neo4j", password="password"):
         """初始化Neo4j连接"""
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
-        
-    def close(self):
+        # 各个分析互相独立，用异步driver并发发出，
+        # 连接池调大到能同时覆盖所有并发任务
+        self.driver = AsyncGraphDatabase.driver(
+            uri, auth=(user, password), max_connection_pool_size=16
+        )
+        # 只读分析会重复发出相同的查询(如标签/关系类型枚举)，
+        # 按(查询文本, 参数)缓存已物化的结果，命中时省掉整个round-trip
+        self._query_cache = {}
+        self._query_cache_maxsize = 256
+
+    async def close(self):
         """关闭连接"""
-        self.driver.close()
-        
-    def run_query(self, query, parameters=None):
-        """执行Cypher查询"""
-        with self.driver.session() as session:
-            result = session.run(query, parameters or {})
-            return list(result)
-    
-    def get_database_info(self):
+        await self.driver.close()
+
+    async def run_query(self, query, parameters=None):
+        """执行Cypher查询 (带只读结果缓存)"""
+        key = (query, tuple(sorted((parameters or {}).items())))
+        cached = self._query_cache.get(key)
+        if cached is not None:
+            return cached
+
+        # 单个session不能同时跑多条查询，并发场景下每次
+        # 从连接池取session，由driver负责连接复用
+        async with self.driver.session(database="neo4j") as session:
+            result = await session.run(query, parameters or {})
+            records = [record async for record in result]
+
+        if len(self._query_cache) >= self._query_cache_maxsize:
+            # 淘汰最早插入的条目，分析场景下基本不会触发
+            self._query_cache.pop(next(iter(self._query_cache)))
+        self._query_cache[key] = records
+        return records
+
+    async def iter_query(self, query, parameters=None):
+        """流式执行Cypher查询，逐条产出记录
+
+        大结果集走这里: driver按fetch_size分批拉取，客户端始终只持有
+        当前一条记录，不像run_query那样整体物化成list(也不进缓存)。
+        """
+        async with self.driver.session(database="neo4j", fetch_size=10_000) as session:
+            result = await session.run(query, parameters or {})
+            async for record in result:
+                yield record
+
+    async def run_single(self, query, parameters=None):
+        """执行只返回一行的Cypher查询 (count等聚合)"""
+        async with self.driver.session(database="neo4j") as session:
+            result = await session.run(query, parameters or {})
+            return await result.single()
+
+    async def ensure_indexes(self):
+        """预建高频过滤属性的索引 (幂等)，让type/name查询走seek而非全标签扫描"""
+        index_cmds = [
+            "CREATE INDEX entity_type_idx IF NOT EXISTS FOR (n:Entity) ON (n.type)",
+            "CREATE INDEX entity_name_idx IF NOT EXISTS FOR (n:Entity) ON (n.name)",
+        ]
+        for cmd in index_cmds:
+            try:
+                await self.run_query(cmd)
+            except Exception as e:
+                print(f"⚠️  创建索引失败: {e}")
+
+    async def get_database_info(self):
         """获取数据库基本信息"""
         print("🔍 数据库基本信息")
         print("=" * 50)
-        
+
+        # 这些都是单行聚合，用.single()直接取行，不必物化list
         # 获取节点总数
-        result = self.run_query("MATCH (n) RETURN count(n) as total_nodes")
-        total_nodes = result[0]['total_nodes']
+        record = await self.run_single("MATCH (n) RETURN count(n) as total_nodes")
+        total_nodes = record['total_nodes']
         print(f"总节点数: {total_nodes:,}")
-        
+
         # 获取关系总数
-        result = self.run_query("MATCH ()-[r]->() RETURN count(r) as total_relationships")
-        total_relationships = result[0]['total_relationships']
+        record = await self.run_single("MATCH ()-[r]->() RETURN count(r) as total_relationships")
+        total_relationships = record['total_relationships']
         print(f"总关系数: {total_relationships:,}")
-        
+
         # 获取标签数量
-        result = self.run_query("CALL db.labels() YIELD label RETURN count(label) as total_labels")
-        total_labels = result[0]['total_labels']
+        record = await self.run_single("CALL db.labels() YIELD label RETURN count(label) as total_labels")
+        total_labels = record['total_labels']
         print(f"标签种类数: {total_labels}")
-        
+
         # 获取关系类型数量
-        result = self.run_query("CALL db.relationshipTypes() YIELD relationshipType RETURN count(relationshipType) as total_types")
-        total_types = result[0]['total_types']
+        record = await self.run_single("CALL db.relationshipTypes() YIELD relationshipType RETURN count(relationshipType) as total_types")
+        total_types = record['total_types']
         print(f"关系类型数: {total_types}")
-        
+
         return {
             'total_nodes': total_nodes,
             'total_relationships': total_relationships,
             'total_labels': total_labels,
             'total_types': total_types
         }
-    
-    def analyze_node_labels(self):
+
+    async def analyze_node_labels(self):
         """分析节点标签分布"""
-        print("\n🏷️ 节点标签分布")
-        print("=" * 50)
-        
-        # 获取所有标签及其节点数量
+        # 并发执行时stdout是共享的，各分析先攒齐整段再一次性输出
+        lines = ["\n🏷️ 节点标签分布", "=" * 50]
+
+        # 一次聚合查询拿到所有标签的节点数量，
+        # 避免每个标签一次round-trip的N+1模式，排序也交给服务端
         query = """
-        CALL db.labels() YIELD label
-        MATCH (n:`${label}`)
-        RETURN label, count(n) as count
+        MATCH (n)
+        UNWIND labels(n) as label
+        RETURN label, count(*) as count
         ORDER BY count DESC
         """
-        
-        # 由于上面的查询有语法问题，我们分步执行
-        labels = self.run_query("CALL db.labels() YIELD label RETURN label")
-        
-        label_counts = []
-        for record in labels:
-            label = record['label']
-            result = self.run_query(f"MATCH (n:`{label}`) RETURN count(n) as count")
-            count = result[0]['count']
-            label_counts.append({'label': label, 'count': count})
-        
-        # 按数量排序
-        label_counts.sort(key=lambda x: x['count'], reverse=True)
-        
+        results = await self.run_query(query)
+        label_counts = [{'label': record['label'], 'count': record['count']}
+                        for record in results]
+
         total_nodes = sum(item['count'] for item in label_counts)
-        
+
         for item in label_counts:
             percentage = item['count'] / total_nodes * 100
-            print(f"{item['label']:<20}: {item['count']:>8,} ({percentage:>5.1f}%)")
-        
+            lines.append(f"{item['label']:<20}: {item['count']:>8,} ({percentage:>5.1f}%)")
+
+        print("\n".join(lines))
         return label_counts
-    
-    def analyze_relationship_types(self):
+
+    async def analyze_relationship_types(self):
         """分析关系类型分布"""
-        print("\n🔗 关系类型分布")
-        print("=" * 50)
-        
-        # 获取所有关系类型及其数量
-        rel_types = self.run_query("CALL db.relationshipTypes() YIELD relationshipType RETURN relationshipType")
-        
-        rel_counts = []
-        for record in rel_types:
-            rel_type = record['relationshipType']
-            result = self.run_query(f"MATCH ()-[r:`{rel_type}`]->() RETURN count(r) as count")
-            count = result[0]['count']
-            rel_counts.append({'type': rel_type, 'count': count})
-        
-        # 按数量排序
-        rel_counts.sort(key=lambda x: x['count'], reverse=True)
-        
+        lines = ["\n🔗 关系类型分布", "=" * 50]
+
+        # 同样用一次聚合查询统计所有关系类型
+        query = """
+        MATCH ()-[r]->()
+        RETURN type(r) as type, count(*) as count
+        ORDER BY count DESC
+        """
+        results = await self.run_query(query)
+        rel_counts = [{'type': record['type'], 'count': record['count']}
+                      for record in results]
+
         total_rels = sum(item['count'] for item in rel_counts)
-        
+
         for item in rel_counts:
             percentage = item['count'] / total_rels * 100
-            print(f"{item['type']:<20}: {item['count']:>8,} ({percentage:>5.1f}%)")
-        
+            lines.append(f"{item['type']:<20}: {item['count']:>8,} ({percentage:>5.1f}%)")
+
+        print("\n".join(lines))
         return rel_counts
-    
-    def analyze_node_properties(self):
+
+    async def analyze_node_properties(self):
         """分析节点属性结构"""
-        print("\n📊 节点属性结构分析")
-        print("=" * 50)
-        
-        # 获取所有标签
-        labels = self.run_query("CALL db.labels() YIELD label RETURN label")
-        
-        for record in labels:
-            label = record['label']
-            print(f"\n🏷️ 标签: {label}")
-            print("-" * 30)
-            
-            # 获取该标签下节点的属性
-            query = f"""
-            MATCH (n:`{label}`)
-            RETURN keys(n) as properties
-            LIMIT 100
-            """
-            
-            results = self.run_query(query)
-            
-            if results:
-                # 统计属性出现频率
-                prop_counts = defaultdict(int)
-                for result in results:
-                    props = result['properties']
-                    for prop in props:
-                        prop_counts[prop] += 1
-                
-                # 显示属性统计
-                for prop, count in sorted(prop_counts.items()):
-                    percentage = count / len(results) * 100
-                    print(f"  {prop:<20}: {count:>3} ({percentage:>5.1f}%)")
-                
-                # 移除示例数据打印
-    
-    def analyze_relationship_properties(self):
+        lines = ["\n📊 节点属性结构分析", "=" * 50]
+
+        # 一次查询完成所有标签的属性采样和频率统计，
+        # 聚合在服务端进行，不再把每个节点的keys列表拉回Python累加
+        query = """
+        CALL db.labels() YIELD label
+        CALL {
+            WITH label
+            MATCH (n) WHERE label IN labels(n)
+            WITH n LIMIT 100
+            WITH count(n) as sampled, collect(n) as sample
+            UNWIND sample as n
+            UNWIND keys(n) as prop
+            RETURN sampled, prop, count(*) as count
+        }
+        RETURN label, max(sampled) as sampled,
+               collect({prop: prop, count: count}) as props
+        ORDER BY label
+        """
+        # 每行带着整组属性采样，流式消费，不整体物化
+        async for record in self.iter_query(query):
+            lines.append(f"\n🏷️ 标签: {record['label']}")
+            lines.append("-" * 30)
+
+            sampled = record['sampled']
+            # 显示属性统计
+            for item in sorted(record['props'], key=lambda p: p['prop']):
+                percentage = item['count'] / sampled * 100
+                lines.append(f"  {item['prop']:<20}: {item['count']:>3} ({percentage:>5.1f}%)")
+
+        print("\n".join(lines))
+
+    async def analyze_relationship_properties(self):
         """分析关系属性结构"""
-        print("\n🔗 关系属性结构分析")
-        print("=" * 50)
-        
-        # 获取所有关系类型
-        rel_types = self.run_query("CALL db.relationshipTypes() YIELD relationshipType RETURN relationshipType")
-        
-        for record in rel_types:
-            rel_type = record['relationshipType']
-            print(f"\n🔗 关系类型: {rel_type}")
-            print("-" * 30)
-            
-            # 获取该关系类型的属性
-            query = f"""
-            MATCH ()-[r:`{rel_type}`]->()
-            RETURN keys(r) as properties
-            LIMIT 100
-            """
-            
-            results = self.run_query(query)
-            
-            if results:
-                # 统计属性出现频率
-                prop_counts = defaultdict(int)
-                for result in results:
-                    props = result['properties']
-                    for prop in props:
-                        prop_counts[prop] += 1
-                
-                # 显示属性统计
-                for prop, count in sorted(prop_counts.items()):
-                    percentage = count / len(results) * 100
-                    print(f"  {prop:<20}: {count:>3} ({percentage:>5.1f}%)")
-                
-                # 移除示例数据打印
-    
-    def analyze_connectivity(self):
+        lines = ["\n🔗 关系属性结构分析", "=" * 50]
+
+        # 与节点属性分析同构: 一次查询覆盖所有关系类型
+        query = """
+        CALL db.relationshipTypes() YIELD relationshipType
+        CALL {
+            WITH relationshipType
+            MATCH ()-[r]->() WHERE type(r) = relationshipType
+            WITH r LIMIT 100
+            WITH count(r) as sampled, collect(r) as sample
+            UNWIND sample as r
+            UNWIND keys(r) as prop
+            RETURN sampled, prop, count(*) as count
+        }
+        RETURN relationshipType, max(sampled) as sampled,
+               collect({prop: prop, count: count}) as props
+        ORDER BY relationshipType
+        """
+        # 同样流式消费
+        async for record in self.iter_query(query):
+            lines.append(f"\n🔗 关系类型: {record['relationshipType']}")
+            lines.append("-" * 30)
+
+            sampled = record['sampled']
+            # 显示属性统计
+            for item in sorted(record['props'], key=lambda p: p['prop']):
+                percentage = item['count'] / sampled * 100
+                lines.append(f"  {item['prop']:<20}: {item['count']:>3} ({percentage:>5.1f}%)")
+
+        print("\n".join(lines))
+
+    async def analyze_connectivity(self):
         """分析图的连通性"""
-        print("\n🌐 图连通性分析")
-        print("=" * 50)
-        
-        # 计算孤立节点
+        lines = ["\n🌐 图连通性分析", "=" * 50]
+
+        # 计算孤立节点 (Neo4j 5的EXISTS子查询形式，按度判断即可提前终止)
         isolated_query = """
         MATCH (n)
-        WHERE NOT (n)--()
+        WHERE NOT EXISTS { (n)--() }
         RETURN count(n) as isolated_count
         """
-        isolated_result = self.run_query(isolated_query)
+        isolated_result = await self.run_query(isolated_query)
         isolated_count = isolated_result[0]['isolated_count']
-        print(f"孤立节点数: {isolated_count:,}")
-        
-        # 计算连通分量
-        components_query = """
-        CALL gds.alpha.scc.stream('*')
-        YIELD componentId, nodeId
-        RETURN componentId, count(nodeId) as component_size
-        ORDER BY component_size DESC
-        LIMIT 10
-        """
-        
+        lines.append(f"孤立节点数: {isolated_count:,}")
+
+        # 先探测GDS插件是否可用，不可用时直接跳过而不是让查询报错
         try:
-            components = self.run_query(components_query)
-            print(f"\n最大连通分量:")
+            await self.run_query("RETURN gds.version() as version")
+        except Exception:
+            lines.append("  GDS插件不可用，跳过连通分量计算")
+            print("\n".join(lines))
+            return
+
+        # 计算连通分量: 先投影再流式计算，最后清理投影图
+        try:
+            await self.run_query("""
+                CALL gds.graph.project('scc_tmp', '*', '*')
+                YIELD graphName
+                RETURN graphName
+            """)
+            components = await self.run_query("""
+                CALL gds.scc.stream('scc_tmp')
+                YIELD componentId
+                RETURN componentId, count(*) as component_size
+                ORDER BY component_size DESC
+                LIMIT 10
+            """)
+            lines.append(f"\n最大连通分量:")
             for i, comp in enumerate(components[:5], 1):
-                print(f"  分量{i}: {comp['component_size']:,} 个节点")
+                lines.append(f"  分量{i}: {comp['component_size']:,} 个节点")
         except Exception as e:
-            print(f"  无法计算连通分量: {e}")
-    
-    def get_sample_relationships(self):
+            lines.append(f"  无法计算连通分量: {e}")
+        finally:
+            try:
+                await self.run_query("CALL gds.graph.drop('scc_tmp', false)")
+            except Exception:
+                pass
+
+        print("\n".join(lines))
+
+    async def get_sample_relationships(self):
         """获取关系示例"""
-        print("\n🔗 关系示例")
-        print("=" * 50)
-        
-        # 获取每种关系类型的示例
-        rel_types = self.run_query("CALL db.relationshipTypes() YIELD relationshipType RETURN relationshipType")
-        
-        for record in rel_types:
-            rel_type = record['relationshipType']
-            print(f"\n🔗 {rel_type} 关系示例:")
-            print("-" * 30)
-            
-            query = f"""
-            MATCH (a)-[r:`{rel_type}`]->(b)
-            RETURN a.name as source, b.name as target, r
+        lines = ["\n🔗 关系示例", "=" * 50]
+
+        # 一次查询为每种关系类型各取3条示例，
+        # 不再按类型逐个round-trip，客户端只负责格式化
+        query = """
+        CALL db.relationshipTypes() YIELD relationshipType
+        CALL {
+            WITH relationshipType
+            MATCH (a)-[r]->(b)
+            WHERE type(r) = relationshipType
+            RETURN a.name as source, b.name as target
             LIMIT 3
-            """
-            
-            results = self.run_query(query)
-            
-            for i, result in enumerate(results, 1):
-                source = result.get('source', 'N/A')
-                target = result.get('target', 'N/A')
-                rel_props = dict(result['r'])
-                print(f"  示例{i}: {source} --[{rel_type}]--> {target}")
-                # 移除属性打印
-                # if rel_props:
-                #     print(f"      属性: {rel_props}")
-    
-    def run_full_analysis(self):
+        }
+        RETURN relationshipType, collect({source: source, target: target}) as samples
+        ORDER BY relationshipType
+        """
+        results = await self.run_query(query)
+
+        for record in results:
+            rel_type = record['relationshipType']
+            lines.append(f"\n🔗 {rel_type} 关系示例:")
+            lines.append("-" * 30)
+
+            for i, sample in enumerate(record['samples'], 1):
+                source = sample.get('source') or 'N/A'
+                target = sample.get('target') or 'N/A'
+                lines.append(f"  示例{i}: {source} --[{rel_type}]--> {target}")
+
+        print("\n".join(lines))
+
+    async def run_full_analysis(self):
         """运行完整分析"""
         print("🔍 Neo4j数据库分析报告")
         print("=" * 60)
-        
+
         try:
+            # 预建索引
+            await self.ensure_indexes()
+
             # 基本信息
-            self.get_database_info()
-            
-            # 节点标签分析
-            self.analyze_node_labels()
-            
-            # 关系类型分析
-            self.analyze_relationship_types()
-            
-            # 节点属性分析
-            self.analyze_node_properties()
-            
-            # 关系属性分析
-            self.analyze_relationship_properties()
-            
-            # 连通性分析
-            self.analyze_connectivity()
-            
-            # 关系示例
-            self.get_sample_relationships()
-            
+            await self.get_database_info()
+
+            # 其余分析互相独立，并发执行，
+            # 网络往返和服务端执行相互重叠
+            await asyncio.gather(
+                self.analyze_node_labels(),
+                self.analyze_relationship_types(),
+                self.analyze_node_properties(),
+                self.analyze_relationship_properties(),
+                self.analyze_connectivity(),
+                self.get_sample_relationships(),
+            )
+
         except Exception as e:
             print(f"❌ 分析过程中出现错误: {e}")
         finally:
-            self.close()
+            await self.close()
 
-def main():
+async def main():
     """主函数"""
     # 默认连接参数，可以根据实际情况修改
     uri = "bolt://localhost:7687"
     user = "neo4j"
     password = "password"
-    
+
     print("🔍 开始分析Neo4j数据库...")
     print("请确保Neo4j服务正在运行")
     print("=" * 60)
-    
+
     try:
         analyzer = Neo4jAnalyzer(uri, user, password)
-        analyzer.run_full_analysis()
+        await analyzer.run_full_analysis()
         print("\n✅ 分析完成!")
-        
+
     except Exception as e:
         print(f"❌ 连接失败: {e}")
         print("请检查:")
@@ -306,4 +355,4 @@ def main():
         print("3. 防火墙设置")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    asyncio.run(main())
@@ -5,29 +5,102 @@
 支持不同实体类型的颜色显示和可视化
 """
 
+import asyncio
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 import pandas as pd
 import numpy as np
-from neo4j import GraphDatabase
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from neo4j import GraphDatabase, AsyncGraphDatabase
 import json
+import re
 import sys
 import time
 from typing import Dict, List, Any, Optional
 import warnings
 warnings.filterwarnings('ignore')
 
+# 批量导入的Cypher模板，提升到模块级:
+# 同一查询文本在所有批次间复用，服务端plan cache按文本命中。
+# 实体批次按SoA(列数组)传参: 每列一个同构list，属性键名在查询文本里
+# 出现一次，不随每行的dict重复上送；属性map在服务端按下标拼出后
+# 一次SET写入。type在一个批次内是常量，作为$type每批传一次
+_ENTITY_CREATE_TEMPLATE = """
+    UNWIND range(0, size($ids) - 1) as i
+    CREATE (e:{label_expr})
+    SET e = {{id: $ids[i], name: $names[i], description: $descs[i],
+             human_readable_id: $hrids[i], degree: $degrees[i]}},
+        e.type = $type
+"""
+
+# SoA形态下各列对应的参数名 (frame列名 → Cypher参数)
+_ENTITY_SOA_PARAMS = {
+    'id': 'ids',
+    'name': 'names',
+    'description': 'descs',
+    'human_readable_id': 'hrids',
+    'degree': 'degrees',
+}
+
+# APOC可用时标签作为每行字段动态指定，一个批次一条查询即可覆盖
+# 全部标签，不必按标签分组后逐组发送
+_ENTITY_CREATE_APOC = """
+    UNWIND $entities as entity
+    CALL apoc.create.node(['Entity', entity.label], {
+        id: entity.id, name: entity.name, type: entity.type,
+        description: entity.description,
+        human_readable_id: entity.human_readable_id, degree: entity.degree
+    }) YIELD node
+    RETURN count(node)
+"""
+
+_REL_CREATE_BY_ID = """
+    UNWIND $relationships as rel
+    MATCH (source:Entity {id: rel.source_id})
+    MATCH (target:Entity {id: rel.target_id})
+    CREATE (source)-[r:RELATED_TO]->(target)
+    SET r.id = rel.id,
+        r.description = rel.description,
+        r.weight = rel.weight,
+        r.rank = rel.rank
+"""
+
 class TCMNeo4jBuilder:
     """中医知识图谱Neo4j构建器"""
-    
-    def __init__(self, uri: str = "neo4j://localhost", username: str = "neo4j", password: str = "password", database: str = "neo4j"):
+
+    # 标签清理用的特殊字符集，类级预编译一次，
+    # 不在每次调用里重新构造pattern
+    _LABEL_STRIP_RE = re.compile(r'[（）()\[\]{}，。、/\\<>|*?:"\'`~!@#$%^&+=\s]')
+
+
+    def __init__(self, uri: str = "neo4j://localhost", username: str = "neo4j", password: str = "password", database: str = "neo4j",
+                 max_concurrent_batches: int = 8):
         """初始化Neo4j连接"""
         self.uri = uri
         self.username = username
         self.password = password
         self.database = database
         self.driver = None
-        
+
+        # 批量导入时同时在途的批次数上限 (相当于worker数，
+        # 调大直到服务器CPU/磁盘饱和为止；每个批次独占一个session)
+        self.max_concurrent_batches = max_concurrent_batches
+
+        # 自动调优得到的批大小缓存 (实体/关系payload大小不同，分开调)
+        self._entity_batch_size = None
+        self._rel_batch_size = None
+
+        # APOC探测结果缓存 (None=未探测)
+        self._apoc_available = None
+
         # 动态类型映射将在load_entities时生成
         self.type_to_label = {}
+        # 反向映射(标签→中文类型)，统计展示时O(1)查找而不是遍历type_to_label
+        self.label_to_type = {}
         self.actual_types = set()
     
     def connect(self) -> bool:
@@ -83,42 +156,67 @@ class TCMNeo4jBuilder:
                 print("❌ 数据库连接未建立")
                 return False
             with self.driver.session(database=self.database) as session:
-                # 删除所有数据
-                session.run("MATCH (n) DETACH DELETE n")
+                # 删除所有数据: 一条DETACH DELETE会把全部删除塞进单个
+                # 事务，大图直接打爆服务端堆。CALL { } IN TRANSACTIONS
+                # 让服务端按1万行一个子事务分批提交 (必须跑在auto-commit
+                # 事务里，所以这里不能用execute_write)
+                session.run("""
+                    MATCH (n)
+                    CALL {
+                        WITH n
+                        DETACH DELETE n
+                    } IN TRANSACTIONS OF 10000 ROWS
+                """).consume()
                 print("✅ 数据库已清空")
             return True
         except Exception as e:
             print(f"❌ 清空数据库失败: {e}")
             return False
     
+    def create_id_constraint(self):
+        """只创建Entity.id唯一约束 (关系导入按id MATCH要用)
+
+        在节点导入完成之后、关系导入之前调用: 此时一次性扫描建索引，
+        而不是让节点导入的每一行都付出索引维护成本。
+        """
+        print("📊 创建Entity.id唯一约束...")
+
+        if not self.driver:
+            print("❌ 数据库连接未建立")
+            return
+
+        with self.driver.session(database=self.database) as session:
+            try:
+                session.run("CREATE CONSTRAINT entity_id_unique IF NOT EXISTS FOR (e:Entity) REQUIRE e.id IS UNIQUE")
+                print("   ✅ entity_id_unique 创建成功")
+            except Exception as e:
+                print(f"   ⚠️  entity_id_unique: {e}")
+
     def create_constraints_and_indexes(self):
-        """创建约束和索引"""
+        """创建其余约束和索引
+
+        推迟到实体和关系都导入完成后再建: 批量CREATE期间没有索引
+        需要逐行维护，导入快2-3倍；建索引变成导入后的一次性扫描。
+
+        所有节点统一带Entity标签，查询也都经由它寻址，所以只在
+        Entity上建name/type索引即可——不必每个中文标签各建一套
+        (N个标签 × 3条DDL，每条各占一次扫描和一份索引存储)。
+        id唯一约束已由create_id_constraint提前建好。
+        """
         print("📊 创建约束和索引...")
-        
+
         if not self.driver:
             print("❌ 数据库连接未建立")
             return
-        
-        # 为所有可能的实体类型创建约束和索引
-        entity_labels = set(self.type_to_label.values())
-        entity_labels.add("Entity")  # 添加默认标签
-        
-        constraints_and_indexes = []
-        
-        # 为每个实体类型创建约束和索引
-        for label in entity_labels:
-            constraints_and_indexes.extend([
-                f"CREATE CONSTRAINT {label.lower()}_id_unique IF NOT EXISTS FOR (e:{label}) REQUIRE e.id IS UNIQUE",
-                f"CREATE INDEX {label.lower()}_name_index IF NOT EXISTS FOR (e:{label}) ON (e.name)",
-                f"CREATE INDEX {label.lower()}_type_index IF NOT EXISTS FOR (e:{label}) ON (e.type)",
-            ])
-        
-        # 关系索引
-        constraints_and_indexes.extend([
+
+        constraints_and_indexes = [
+            "CREATE INDEX entity_name_index IF NOT EXISTS FOR (e:Entity) ON (e.name)",
+            "CREATE INDEX entity_type_index IF NOT EXISTS FOR (e:Entity) ON (e.type)",
+            # 关系索引
             "CREATE INDEX relationship_weight_index IF NOT EXISTS FOR ()-[r:RELATED_TO]-() ON (r.weight)",
-            "CREATE INDEX relationship_rank_index IF NOT EXISTS FOR ()-[r:RELATED_TO]-() ON (r.rank)"
-        ])
-        
+            "CREATE INDEX relationship_rank_index IF NOT EXISTS FOR ()-[r:RELATED_TO]-() ON (r.rank)",
+        ]
+
         with self.driver.session(database=self.database) as session:
             for cmd in constraints_and_indexes:
                 try:
@@ -127,24 +225,38 @@ class TCMNeo4jBuilder:
                 except Exception as e:
                     print(f"   ⚠️  {cmd}: {e}")
     
+    # 导入管线实际用到的列，加载时裁剪掉其余列
+    ENTITY_COLUMNS = ['id', 'title', 'name', 'type', 'description', 'human_readable_id', 'degree']
+    RELATIONSHIP_COLUMNS = ['id', 'source', 'target', 'description', 'weight', 'rank']
+
+    def _read_parquet_columns(self, file: str, wanted: List[str]) -> pd.DataFrame:
+        """只读取parquet中实际需要且存在的列
+
+        parquet是列存格式，未选中的列根本不会解压，
+        峰值内存按 未用列/总列数 的比例下降。
+        """
+        available = set(pq.read_schema(file).names)
+        columns = [c for c in wanted if c in available]
+        return pd.read_parquet(file, columns=columns)
+
     def load_entities(self, entities_file: str = "./output2/entities.parquet") -> pd.DataFrame:
         """加载实体数据"""
         print(f"📚 加载实体数据: {entities_file}")
         try:
-            # 读取实体数据
-            entities_df = pd.read_parquet(entities_file)
+            # 读取实体数据 (列裁剪)
+            entities_df = self._read_parquet_columns(entities_file, self.ENTITY_COLUMNS)
             print(f"✅ 加载了 {len(entities_df)} 个实体")
             
             # 显示实体类型统计
             if 'type' in entities_df.columns:
-                type_counts = entities_df['type'].value_counts()
+                type_counts = entities_df['type'].value_counts(dropna=False)
                 print("📊 实体类型分布:")
                 for entity_type, count in type_counts.head(10).items():
                     print(f"   {entity_type}: {count}")
-                
-                # 动态生成类型映射
-                unique_types = entities_df['type'].unique()
-                self.generate_type_mappings(unique_types)
+
+                # 动态生成类型映射: 去重结果直接取value_counts的index，
+                # 不对type列再做一次unique()全扫描
+                self.generate_type_mappings(type_counts.index)
             
             return entities_df
             
@@ -156,8 +268,8 @@ class TCMNeo4jBuilder:
         """加载关系数据"""
         print(f"🔗 加载关系数据: {relationships_file}")
         try:
-            # 读取关系数据
-            relationships_df = pd.read_parquet(relationships_file)
+            # 读取关系数据 (列裁剪)
+            relationships_df = self._read_parquet_columns(relationships_file, self.RELATIONSHIP_COLUMNS)
             print(f"✅ 加载了 {len(relationships_df)} 个关系")
             
             # 显示关系权重分布
@@ -176,23 +288,26 @@ class TCMNeo4jBuilder:
     def generate_type_mappings(self, entity_types):
         """根据实际的entity types生成Neo4j标签映射"""
         print("📋 动态生成实体类型映射...")
-        
+
         # 清空现有映射
         self.type_to_label.clear()
-        
+        self.label_to_type.clear()
+
+        # 清洗和正则替换整列向量化，正则用类级预编译的pattern
+        types = pd.Series(list(entity_types))
+        clean = types.fillna('').astype(str).str.strip().str.strip('"')
+        stripped = clean.str.replace(self._LABEL_STRIP_RE, '', regex=True)
+        labels = stripped.where(stripped != '', 'Unknown')
+
         type_count = 0
-        for entity_type in entity_types:
-            if pd.isna(entity_type) or str(entity_type).strip() == '':
+        for clean_type, label in zip(clean, labels):
+            if not clean_type:
                 self.type_to_label[''] = 'Unknown'
                 continue
-                
-            clean_type = str(entity_type).strip().strip('"')
-            if clean_type:
-                # 生成合适的Neo4j标签
-                label = self._generate_neo4j_label(clean_type)
-                self.type_to_label[clean_type] = label
-                type_count += 1
-                
+            self.type_to_label[clean_type] = label
+            self.label_to_type.setdefault(label, clean_type)
+            type_count += 1
+
         print(f"   生成了 {type_count} 个类型映射")
         # 显示前10个映射
         for i, (orig_type, label) in enumerate(list(self.type_to_label.items())[:10]):
@@ -203,18 +318,12 @@ class TCMNeo4jBuilder:
     
     def _generate_neo4j_label(self, chinese_type: str) -> str:
         """为中文类型生成合适的Neo4j标签"""
-        import re
-        
         # Neo4j支持中文标签，只需要简单清理即可
         # 移除特殊字符，保留中文、英文、数字
-        clean_name = re.sub(r'[（）()\[\]{}，。、/\\<>|*?:"\'`~!@#$%^&+=\s]', '', chinese_type)
-        
-        # 如果清理后不为空，直接使用
-        if clean_name:
-            return clean_name
-        else:
-            # 空值或无效名称
-            return "Unknown"
+        clean_name = self._LABEL_STRIP_RE.sub('', chinese_type)
+
+        # 清理后为空说明是无效名称
+        return clean_name if clean_name else "Unknown"
     
     def get_entity_label(self, entity_type: str) -> str:
         """根据实体类型获取Neo4j标签"""
@@ -227,66 +336,225 @@ class TCMNeo4jBuilder:
         # 查找映射，如果没有就使用默认
         return self.type_to_label.get(clean_type, "Entity")
     
-    def create_entities(self, entities_df: pd.DataFrame, batch_size: int = 1000):
+    def _prepare_entities_frame(self, entities_df: pd.DataFrame):
+        """列级向量化完成实体清洗和类型转换，返回(属性frame, 标签Series)
+
+        把每行5-6次str()/pd.notna()调用换成整列的C内核，
+        Bolt导入和CSV导出共用同一份变换。
+        """
+        out = pd.DataFrame(index=entities_df.index)
+        out['id'] = self._clean_str_column(self._column(entities_df, 'id', ''), trim=False)
+        out['type'] = self._clean_str_column(self._column(entities_df, 'type', ''))
+        # title缺列时整列落到name，不能用_column的''默认值——
+        # 空字符串不是NaN，fillna不会再生效，全部节点会变成空名
+        if 'title' in entities_df.columns:
+            name_series = entities_df['title']
+            if 'name' in entities_df.columns:
+                name_series = name_series.fillna(entities_df['name'])
+        else:
+            name_series = self._column(entities_df, 'name', '')
+        out['name'] = self._clean_str_column(name_series)
+        out['description'] = self._clean_str_column(self._column(entities_df, 'description', ''),
+                                                    trim=False, max_len=1000)
+        # 取值范围远在int32以内，frame常驻内存减半；
+        # 发送前astype(object)会统一装箱成Python int，Bolt编码不受影响
+        out['human_readable_id'] = (pd.to_numeric(self._column(entities_df, 'human_readable_id', 0),
+                                                  errors='coerce').fillna(0).astype('int32'))
+        out['degree'] = (pd.to_numeric(self._column(entities_df, 'degree', 0),
+                                       errors='coerce').fillna(0).astype('int32'))
+        # 标签解析同样走向量化map，语义与get_entity_label一致
+        labels = (out['type'].map(self.type_to_label)
+                  .where(out['type'] != '', 'Unknown').fillna('Entity'))
+        return out, labels
+
+    def _prepare_relationships_frame(self, relationships_df: pd.DataFrame) -> pd.DataFrame:
+        """列级清洗关系数据，字符串列走Arrow内核"""
+        out = pd.DataFrame(index=relationships_df.index)
+        out['source_name'] = self._clean_str_column(self._column(relationships_df, 'source', ''))
+        out['target_name'] = self._clean_str_column(self._column(relationships_df, 'target', ''))
+        out['id'] = self._clean_str_column(self._column(relationships_df, 'id', ''), trim=False)
+        out['description'] = self._clean_str_column(self._column(relationships_df, 'description', ''),
+                                                    trim=False, max_len=500)
+        # weight保留float64: float32装箱回Python float会带出
+        # 0.10000000149这类表示噪声写进数据库
+        out['weight'] = (pd.to_numeric(self._column(relationships_df, 'weight', 1.0),
+                                       errors='coerce').fillna(1.0).astype('float64'))
+        out['rank'] = (pd.to_numeric(self._column(relationships_df, 'rank', 0),
+                                     errors='coerce').fillna(0).astype('int32'))
+        return out
+
+    def _autotune_batch_size(self, query: str, param_key: Optional[str], frame: pd.DataFrame, extra: Optional[Dict] = None):
+        """试跑候选批大小，选吞吐量(行/秒)最高的那个
+
+        批太小时RTT占支配，批太大则压服务端堆，最优点取决于平均
+        属性map大小和服务器配置——实测比硬编码可靠。试跑批次会
+        真实写入，返回(最优批大小, 已消费的记录数)，调用方从
+        该偏移继续导入剩余记录。
+        """
+        candidates = (1000, 5000, 20000, 50000)
+        best_size, best_rate = candidates[0], 0.0
+        offset = 0
+        print("   🧪 自动调优批大小...")
+        with self.driver.session(database=self.database) as session:
+            for size in candidates:
+                chunk = frame.iloc[offset:offset + size]
+                if not len(chunk):
+                    break
+                params = self._batch_params(param_key, chunk)
+                start = time.perf_counter()
+                try:
+                    session.execute_write(
+                        lambda tx: tx.run(query, **params, **(extra or {})).consume())
+                except Exception as e:
+                    print(f"   ⚠️  批大小 {size} 试跑失败: {e}")
+                    break
+                elapsed = time.perf_counter() - start
+                offset += len(chunk)
+                rate = len(chunk) / elapsed if elapsed > 0 else 0.0
+                print(f"      批大小 {size}: {rate:,.0f} 行/秒")
+                if rate > best_rate:
+                    best_size, best_rate = size, rate
+        print(f"   🎯 选用批大小: {best_size}")
+        return best_size, offset
+
+    async def _ingest_batches(self, jobs, total: int, unit: str, lanes=None) -> int:
+        """用异步driver并发执行一组UNWIND批次
+
+        同步路径是发一批、等整个round-trip、再发下一批——一半墙钟时间
+        耗在RTT上。这里用信号量限制在途批次数，网络发送、服务端执行
+        和下一批的准备相互重叠，消掉 RTT × 批次数 的串行等待。
+        批次是(cypher, 参数名, 记录frame切片, 批级常量参数)四元组；参数在
+        发送前才从切片生成，任意时刻只有在途窗口内的批次占用参数形态的内存。
+
+        传jobs时所有批次自由并发；传lanes(批次列表的列表)时每条lane
+        内部串行、lane之间并发——关系导入用它保证同一桶的写锁不自撞。
+        """
+        if lanes is None:
+            lanes = [[job] for job in jobs]
+        driver = AsyncGraphDatabase.driver(self.uri, auth=(self.username, self.password))
+        sem = asyncio.Semaphore(self.max_concurrent_batches)
+        progress = {'done': 0, 'last_emit': 0.0}
+
+        async def run_lane(lane_index, lane):
+            for batch_index, (query, param_key, frame_slice, extra) in enumerate(lane):
+                async with sem:
+                    try:
+                        params = self._batch_params(param_key, frame_slice)
+
+                        # 托管事务: 死锁/瞬态网络错误由driver按退避策略
+                        # 自动重传整个函数，而不是让该批次直接失败
+                        async def write_batch(tx):
+                            result = await tx.run(query, **params, **(extra or {}))
+                            await result.consume()
+
+                        async with driver.session(database=self.database) as session:
+                            await session.execute_write(write_batch)
+                        progress['done'] += len(frame_slice)
+                        # 进度行限速到每秒一条: 大导入有上万个批次，
+                        # 逐批刷stdout本身就成了串行化点
+                        now = time.monotonic()
+                        if now - progress['last_emit'] >= 1.0 or progress['done'] >= total:
+                            progress['last_emit'] = now
+                            print(f"   ✅ 已创建 {progress['done']}/{total} 个{unit} ({progress['done']/total*100:.1f}%)")
+                    except Exception as e:
+                        print(f"   ❌ 批次 {lane_index + 1}-{batch_index + 1} 创建失败: {e}")
+
+        try:
+            await asyncio.gather(*(run_lane(i, lane) for i, lane in enumerate(lanes)))
+        finally:
+            await driver.close()
+        return progress['done']
+
+    def _batch_params(self, param_key: Optional[str], frame_slice: pd.DataFrame) -> Dict[str, Any]:
+        """把frame切片转成查询参数
+
+        param_key为None走SoA(列数组)形态: 每列tolist()成一个同构list，
+        属性键名不随每行重复，Bolt payload里也不用逐行打包dict结构；
+        tolist()顺带把numpy标量转成Python原生类型。指定param_key时
+        退回常规的记录dict列表 (astype(object)做同样的类型装箱)。
+        """
+        if param_key is None:
+            return {pname: frame_slice[col].tolist()
+                    for col, pname in _ENTITY_SOA_PARAMS.items()}
+        return {param_key: frame_slice.astype(object).to_dict(orient='records')}
+
+    def _column(self, df: pd.DataFrame, name: str, default) -> pd.Series:
+        """取一列，缺列时给整列默认值 (对齐row.get的语义)"""
+        if name in df.columns:
+            return df[name]
+        return pd.Series(default, index=df.index)
+
+    def _clean_str_column(self, series: pd.Series, trim: bool = True,
+                          max_len: Optional[int] = None) -> pd.Series:
+        """字符串列清洗 (Arrow C内核按列并行，不逐值走Python字符串方法)"""
+        arr = pc.fill_null(pc.cast(pa.Array.from_pandas(series), pa.string()), '')
+        if trim:
+            arr = pc.utf8_trim_whitespace(arr)
+            arr = pc.utf8_trim(arr, '"')
+        if max_len is not None:
+            arr = pc.utf8_slice_codeunits(arr, 0, max_len)
+        return pd.Series(arr.to_pandas().values, index=series.index)
+
+    def _check_apoc(self) -> bool:
+        """探测APOC插件是否可用 (结果缓存，只探测一次)"""
+        if self._apoc_available is None:
+            try:
+                with self.driver.session(database=self.database) as session:
+                    session.run("RETURN apoc.version()").consume()
+                self._apoc_available = True
+            except Exception:
+                self._apoc_available = False
+        return self._apoc_available
+
+    def create_entities(self, entities_df: pd.DataFrame, batch_size: int = 1000, tune: bool = True):
         """批量创建实体节点"""
         print(f"🏗️  创建实体节点 (批次大小: {batch_size})...")
-        
+
         if not self.driver:
             print("❌ 数据库连接未建立")
             return
-        
+
         total_entities = len(entities_df)
-        created_count = 0
-        
-        with self.driver.session(database=self.database) as session:
-            for i in range(0, total_entities, batch_size):
-                batch = entities_df.iloc[i:i+batch_size]
-                
-                # 按标签分组实体数据
-                entities_by_label = {}
-                for _, row in batch.iterrows():
-                    entity_type = str(row.get('type', '')).strip().strip('"') if pd.notna(row.get('type')) else ''
-                    label = self.get_entity_label(entity_type)
-                    
-                    entity_data = {
-                        'id': str(row.get('id', '')),
-                        'name': str(row.get('title', row.get('name', ''))).strip().strip('"'),
-                        'type': entity_type,
-                        'description': str(row.get('description', ''))[:1000] if pd.notna(row.get('description')) else '',
-                        'human_readable_id': int(row.get('human_readable_id', 0)) if pd.notna(row.get('human_readable_id')) else 0,
-                        'degree': int(row.get('degree', 0)) if pd.notna(row.get('degree')) else 0
-                    }
-                    
-                    if label not in entities_by_label:
-                        entities_by_label[label] = []
-                    entities_by_label[label].append(entity_data)
-                
-                # 按标签批量插入
-                batch_created = 0
-                try:
-                    for label, label_entities in entities_by_label.items():
-                        cypher_query = f"""
-                            UNWIND $entities as entity
-                            CREATE (e:{label})
-                            SET e.id = entity.id,
-                                e.name = entity.name,
-                                e.type = entity.type,
-                                e.description = entity.description,
-                                e.human_readable_id = entity.human_readable_id,
-                                e.degree = entity.degree
-                        """
-                        session.run(cypher_query, entities=label_entities)
-                        batch_created += len(label_entities)
-                        print(f"   📋 创建了 {len(label_entities)} 个 {label} 实体")
-                    
-                    created_count += batch_created
-                    print(f"   ✅ 已创建 {created_count}/{total_entities} 个实体 ({created_count/total_entities*100:.1f}%)")
-                    
-                except Exception as e:
-                    print(f"   ❌ 批次 {i//batch_size + 1} 创建失败: {e}")
-        
+
+        out, labels = self._prepare_entities_frame(entities_df)
+
+        if self._check_apoc():
+            # APOC路径: 标签随行传入apoc.create.node，整个frame走同一条
+            # 查询文本，查询数与标签种类数解耦 (plan cache也只占一个槽位)
+            frame = out.copy()
+            frame['label'] = labels
+            grouped = [(_ENTITY_CREATE_APOC, 'entities', frame, None)]
+        else:
+            # 回退: 标签无法参数化，按(标签, type)分组；组内type是常量，
+            # 作为批级参数传一次，frame切片出批次，参数在发送时按SoA生成
+            grouped = []
+            for (label, etype), group in out.groupby([labels, out['type']], sort=False):
+                # 统一附加Entity标签，让entity_id_unique约束索引
+                # 支撑后续按id的关系MATCH
+                label_expr = 'Entity' if label == 'Entity' else f'Entity:{label}'
+                grouped.append((_ENTITY_CREATE_TEMPLATE.format(label_expr=label_expr),
+                                None, group.drop(columns=['type']), {'type': etype}))
+
+        # 在最大的标签组上试跑一次批大小调优，结果缓存复用
+        consumed = 0
+        tuned_frame = None
+        if tune and self._entity_batch_size is None and grouped:
+            query, param_key, frame, extra = max(grouped, key=lambda item: len(item[2]))
+            if len(frame) > batch_size:
+                self._entity_batch_size, consumed = self._autotune_batch_size(query, param_key, frame, extra)
+                tuned_frame = frame
+        batch = self._entity_batch_size or batch_size
+
+        jobs = []
+        for query, param_key, frame, extra in grouped:
+            start = consumed if frame is tuned_frame else 0
+            for i in range(start, len(frame), batch):
+                jobs.append((query, param_key, frame.iloc[i:i+batch], extra))
+
+        created_count = consumed + asyncio.run(self._ingest_batches(jobs, total_entities, '实体'))
+
         print(f"🎉 实体创建完成! 总计: {created_count}")
-        
+
         # 显示实体类型统计
         self.show_entity_statistics()
     
@@ -296,74 +564,166 @@ class TCMNeo4jBuilder:
         
         try:
             with self.driver.session(database=self.database) as session:
-                # 获取所有标签及其实体数量
-                result = session.run("CALL db.labels() YIELD label RETURN label")
-                labels = [record["label"] for record in result]
-                
+                # 一次聚合查询拿到所有标签的计数，
+                # 不再按标签逐个COUNT (每个标签一次round-trip的N+1模式)
+                result = session.run("""
+                    MATCH (n)
+                    UNWIND labels(n) as label
+                    RETURN label, count(*) as count
+                    ORDER BY label
+                """)
+
                 total_entities = 0
-                for label in sorted(labels):
-                    count_result = session.run(f"MATCH (n:{label}) RETURN count(n) as count")
-                    count = count_result.single()["count"]
-                    if count > 0:
-                        # 查找对应的中文类型
-                        chinese_type = ""
-                        for zh_type, en_label in self.type_to_label.items():
-                            if en_label == label:
-                                chinese_type = f" ({zh_type})"
-                                break
-                        print(f"   {label}{chinese_type}: {count}")
-                        total_entities += count
-                
+                for record in result:
+                    label, count = record["label"], record["count"]
+                    # 反向映射一次dict探查拿到中文类型
+                    zh_type = self.label_to_type.get(label)
+                    chinese_type = f" ({zh_type})" if zh_type else ""
+                    print(f"   {label}{chinese_type}: {count}")
+                    total_entities += count
+
                 print(f"   总计: {total_entities} 个实体")
-                
+
         except Exception as e:
             print(f"   ❌ 获取统计信息失败: {e}")
     
-    def create_relationships(self, relationships_df: pd.DataFrame, batch_size: int = 1000):
+    def prepare_relationships(self, relationships_df: pd.DataFrame, entities_df: pd.DataFrame):
+        """清洗关系数据并解析端点id，返回(记录frame, 对应的Cypher)
+
+        端点一律在客户端解析成唯一id: 按name的MATCH走非唯一索引，
+        重名实体会产生叉积，所以不再保留按name匹配的退路。
+        这步是纯CPU工作，与实体导入互相独立——main在实体批次上送
+        期间用后台线程先把它做完，两段耗时相互重叠。
+        """
+        if entities_df is None or 'id' not in entities_df.columns:
+            raise ValueError("解析关系端点需要带id列的实体表")
+
+        out = self._prepare_relationships_frame(relationships_df)
+
+        # 一次merge把name解析成唯一id，
+        # 按id的MATCH由entity_id_unique约束索引支撑。
+        # 查找键必须和节点的name是同一个定义(_prepare_entities_frame，
+        # export_admin_csv同样用它): 单独从title清洗会让title缺失的
+        # 实体建点用name、查表却用空键，相关关系全部静默丢弃
+        ent_frame, _ = self._prepare_entities_frame(entities_df)
+        ent = pd.DataFrame()
+        ent['name'] = ent_frame['name']
+        ent['entity_id'] = ent_frame['id']
+        ent = ent.drop_duplicates('name')
+        out = out.merge(ent.rename(columns={'name': 'source_name', 'entity_id': 'source_id'}),
+                        on='source_name', how='left')
+        out = out.merge(ent.rename(columns={'name': 'target_name', 'entity_id': 'target_id'}),
+                        on='target_name', how='left')
+
+        unresolved = out['source_id'].isna() | out['target_id'].isna()
+        if unresolved.any():
+            print(f"   ⚠️  {int(unresolved.sum()):,} 个关系的端点无法解析为实体id，已跳过")
+            out = out[~unresolved]
+
+        return out, _REL_CREATE_BY_ID
+
+    def create_relationships(self, relationships_df: pd.DataFrame, entities_df: pd.DataFrame,
+                             batch_size: int = 1000, tune: bool = True, prepared=None):
         """批量创建关系"""
         print(f"🔗 创建关系 (批次大小: {batch_size})...")
-        
-        total_relationships = len(relationships_df)
-        created_count = 0
-        
-        with self.driver.session(database=self.database) as session:
-            for i in range(0, total_relationships, batch_size):
-                batch = relationships_df.iloc[i:i+batch_size]
-                
-                # 准备批次数据
-                relationships_data = []
-                for _, row in batch.iterrows():
-                    relationship_data = {
-                        'source_name': str(row.get('source', '')).strip().strip('"'),
-                        'target_name': str(row.get('target', '')).strip().strip('"'),
-                        'id': str(row.get('id', '')),
-                        'description': str(row.get('description', ''))[:500] if pd.notna(row.get('description')) else '',
-                        'weight': float(row.get('weight', 1.0)) if pd.notna(row.get('weight')) else 1.0,
-                        'rank': int(row.get('rank', 0)) if pd.notna(row.get('rank')) else 0
-                    }
-                    relationships_data.append(relationship_data)
-                
-                # 批量插入关系 - 使用通用标签匹配
-                try:
-                    session.run("""
-                        UNWIND $relationships as rel
-                        MATCH (source {name: rel.source_name})
-                        MATCH (target {name: rel.target_name})
-                        CREATE (source)-[r:RELATED_TO]->(target)
-                        SET r.id = rel.id,
-                            r.description = rel.description,
-                            r.weight = rel.weight,
-                            r.rank = rel.rank
-                    """, relationships=relationships_data)
-                    
-                    created_count += len(batch)
-                    print(f"   ✅ 已创建 {created_count}/{total_relationships} 个关系 ({created_count/total_relationships*100:.1f}%)")
-                    
-                except Exception as e:
-                    print(f"   ❌ 批次 {i//batch_size + 1} 创建失败: {e}")
-        
+
+        # prepared允许调用方提前(并行)做完清洗和id解析
+        if prepared is None:
+            prepared = self.prepare_relationships(relationships_df, entities_df)
+        out, cypher_query = prepared
+
+        total_relationships = len(out)
+
+        consumed = 0
+        if tune and self._rel_batch_size is None and total_relationships > batch_size:
+            self._rel_batch_size, consumed = self._autotune_batch_size(cypher_query, 'relationships', out)
+        batch = self._rel_batch_size or batch_size
+
+        # 并发批次若命中同一个source节点，会在Neo4j的节点锁上互相
+        # 串行。按source哈希分桶，桶内批次串行、桶间并发，让同时
+        # 在途的写锁集合尽量不相交 (target端仍可能跨桶碰撞)
+        rest = out.iloc[consumed:]
+        bucket_ids = pd.util.hash_pandas_object(rest['source_id'], index=False).to_numpy() % self.max_concurrent_batches
+        lanes = []
+        for b in range(self.max_concurrent_batches):
+            bucket = rest[bucket_ids == b]
+            if len(bucket):
+                lanes.append([(cypher_query, 'relationships', bucket.iloc[i:i+batch], None)
+                              for i in range(0, len(bucket), batch)])
+
+        created_count = consumed + asyncio.run(self._ingest_batches(None, total_relationships, '关系', lanes=lanes))
+
         print(f"🎉 关系创建完成! 总计: {created_count}")
     
+    def export_admin_csv(self, entities_df: pd.DataFrame, relationships_df: pd.DataFrame,
+                         out_dir: str = "./neo4j_import"):
+        """导出neo4j-admin database import格式的CSV (纯向量化to_csv，无iterrows)"""
+        print(f"📦 导出批量导入CSV到: {out_dir}")
+        os.makedirs(out_dir, exist_ok=True)
+
+        # 节点文件: id:ID,name,type,...,:LABEL (复用Bolt路径的清洗)
+        out, labels = self._prepare_entities_frame(entities_df)
+        nodes = out.rename(columns={'id': 'id:ID',
+                                    'human_readable_id': 'human_readable_id:long',
+                                    'degree': 'degree:long'})
+        nodes[':LABEL'] = ('Entity;' + labels).where(labels != 'Entity', 'Entity')
+        nodes_path = os.path.join(out_dir, 'nodes.csv')
+        nodes.to_csv(nodes_path, index=False)
+
+        # 关系文件: :START_ID,:END_ID,...,:TYPE (端点按name join成id)
+        ent = pd.DataFrame()
+        ent['name'] = out['name']
+        ent['entity_id'] = out['id']
+        ent = ent.drop_duplicates('name')
+
+        rels = self._prepare_relationships_frame(relationships_df)
+        rels = rels.rename(columns={'weight': 'weight:float', 'rank': 'rank:long'})
+        rels = rels.merge(ent.rename(columns={'name': 'source_name', 'entity_id': ':START_ID'}),
+                          on='source_name', how='left')
+        rels = rels.merge(ent.rename(columns={'name': 'target_name', 'entity_id': ':END_ID'}),
+                          on='target_name', how='left')
+        unresolved = rels[':START_ID'].isna() | rels[':END_ID'].isna()
+        if unresolved.any():
+            print(f"   ⚠️  {int(unresolved.sum()):,} 个关系的端点无法解析为实体id，已跳过")
+            rels = rels[~unresolved]
+        rels[':TYPE'] = 'RELATED_TO'
+        rels_path = os.path.join(out_dir, 'relationships.csv')
+        rels[[':START_ID', ':END_ID', 'id', 'description', 'weight:float', 'rank:long', ':TYPE']].to_csv(rels_path, index=False)
+
+        print(f"   ✅ {len(nodes):,} 个节点 → {nodes_path}")
+        print(f"   ✅ {len(rels):,} 个关系 → {rels_path}")
+        return nodes_path, rels_path
+
+    def bulk_import(self, entities_df: pd.DataFrame, relationships_df: pd.DataFrame,
+                    out_dir: str = "./neo4j_import") -> bool:
+        """冷库场景走neo4j-admin离线批量导入
+
+        离线导入绕过整个事务层，对百万级图谱通常比Bolt UNWIND
+        快1-2个数量级；要求目标数据库已停止且内容可被覆盖。
+        增量更新仍走create_entities/create_relationships的Bolt路径。
+        """
+        nodes_path, rels_path = self.export_admin_csv(entities_df, relationships_df, out_dir)
+
+        cmd = [
+            'neo4j-admin', 'database', 'import', 'full',
+            f'--nodes={nodes_path}',
+            f'--relationships={rels_path}',
+            '--overwrite-destination',
+            self.database,
+        ]
+        print(f"🚚 执行离线导入: {' '.join(cmd)}")
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True)
+        except FileNotFoundError:
+            print("❌ 找不到neo4j-admin命令，请确认Neo4j安装目录在PATH中")
+            return False
+
+        if result.returncode == 0:
+            print("✅ 离线批量导入完成，请启动数据库后使用")
+            return True
+        print(f"❌ 离线导入失败:\n{result.stderr}")
+        return False
+
     def demo_typed_queries(self):
         """演示基于类型标签的查询优势"""
         print("\n🔍 演示多标签查询功能:")
@@ -397,18 +757,24 @@ class TCMNeo4jBuilder:
                     print(f"   - 疾病: {record['disease.name']} → 方剂: {record['formula.name']} → 药材: {record['drug.name']}")
                 
                 # 示例查询4：统计各类型实体的连接度
+                # 标签列表作为参数一次传入，CALL子查询逐标签聚合，
+                # 六次round-trip合并成一次
                 print("\n4. 各类型实体的平均连接度:")
                 labels = ['Drug', 'Formula', 'Disease', 'Symptom', 'Doctor', 'Efficacy']
-                for label in labels:
-                    result = session.run(f"""
-                        MATCH (n:{label})
+                result = session.run("""
+                    UNWIND $labels as label
+                    CALL {
+                        WITH label
+                        MATCH (n) WHERE label IN labels(n)
                         OPTIONAL MATCH (n)-[r]-()
                         WITH n, count(r) as degree
                         RETURN avg(degree) as avg_degree, count(n) as node_count
-                    """)
-                    record = result.single()
-                    if record and record['node_count'] > 0:
-                        print(f"   - {label}: 平均连接度 {record['avg_degree']:.2f}, 节点数 {record['node_count']}")
+                    }
+                    RETURN label, avg_degree, node_count
+                """, labels=labels)
+                for record in result:
+                    if record['node_count'] > 0:
+                        print(f"   - {record['label']}: 平均连接度 {record['avg_degree']:.2f}, 节点数 {record['node_count']}")
                 
         except Exception as e:
             print(f"   ❌ 查询演示失败: {e}")
@@ -421,40 +787,33 @@ class TCMNeo4jBuilder:
         
         with self.driver.session(database=self.database) as session:
             try:
-                # 节点统计 - 统计所有实体类型
-                result = session.run("MATCH (n) WHERE size(labels(n)) > 0 RETURN count(n) as node_count")
-                stats['node_count'] = result.single()["node_count"]
-                
-                # 关系统计
-                result = session.run("MATCH ()-[r:RELATED_TO]->() RETURN count(r) as rel_count")
-                stats['relationship_count'] = result.single()["rel_count"]
-                
-                # 实体类型统计 - 手动统计各标签
-                stats['entity_types'] = []
-                label_result = session.run("CALL db.labels() YIELD label RETURN label")
-                labels = [record["label"] for record in label_result]
-                
-                for label in labels:
-                    count_result = session.run(f"MATCH (n:{label}) RETURN count(n) as count")
-                    record = count_result.single()
-                    if record and record["count"] > 0:
-                        stats['entity_types'].append((label, record["count"]))
-                
-                # 按数量排序
-                stats['entity_types'].sort(key=lambda x: x[1], reverse=True)
-                
-                # 连接度统计 - 统计所有实体
-                result = session.run("""
-                    MATCH (n) WHERE size(labels(n)) > 0
-                    RETURN avg(n.degree) as avg_degree, max(n.degree) as max_degree, min(n.degree) as min_degree
-                """)
-                degree_stats = result.single()
+                # 节点/关系/连接度三组聚合用CALL子查询合并成一次round-trip
+                record = session.run("""
+                    CALL { MATCH (n) WHERE size(labels(n)) > 0 RETURN count(n) as node_count }
+                    CALL { MATCH ()-[r:RELATED_TO]->() RETURN count(r) as rel_count }
+                    CALL {
+                        MATCH (n) WHERE size(labels(n)) > 0
+                        RETURN avg(n.degree) as avg_degree, max(n.degree) as max_degree, min(n.degree) as min_degree
+                    }
+                    RETURN node_count, rel_count, avg_degree, max_degree, min_degree
+                """).single()
+                stats['node_count'] = record["node_count"]
+                stats['relationship_count'] = record["rel_count"]
                 stats['degree_stats'] = {
-                    'average': round(degree_stats["avg_degree"], 2) if degree_stats["avg_degree"] else 0,
-                    'maximum': degree_stats["max_degree"] or 0,
-                    'minimum': degree_stats["min_degree"] or 0
+                    'average': round(record["avg_degree"], 2) if record["avg_degree"] else 0,
+                    'maximum': record["max_degree"] or 0,
+                    'minimum': record["min_degree"] or 0
                 }
-                
+
+                # 实体类型统计 - 一次聚合查询代替每个标签一次COUNT
+                result = session.run("""
+                    MATCH (n)
+                    UNWIND labels(n) as label
+                    RETURN label, count(*) as count
+                    ORDER BY count DESC
+                """)
+                stats['entity_types'] = [(rec["label"], rec["count"]) for rec in result]
+
             except Exception as e:
                 print(f"❌ 获取统计信息失败: {e}")
         
@@ -482,7 +841,12 @@ class TCMNeo4jBuilder:
                 print(f"   {entity_type}: {count:,}")
     
     def generate_browser_style(self) -> str:
-        """生成Neo4j浏览器基础样式配置"""
+        """生成Neo4j浏览器基础样式配置
+
+        配色只存在于这份grass样式文件里，按type/标签在浏览器端匹配；
+        节点上不落color属性——颜色是type的派生值，逐节点存储只会
+        白占属性存储和每行Bolt上送的字节。
+        """
         print("🎨 生成Neo4j浏览器基础样式...")
         
         # 基础样式
@@ -502,11 +866,10 @@ relationship {
   text-color-external: #000000;
   text-color-internal: #FFFFFF;
 }"""
-        
-        # 保存到文件
-        with open("neo4j_browser_style.grass", "w", encoding="utf-8") as f:
-            f.write(basic_style)
-        
+
+        # 保存到文件 (一次write_text，免去手动open/write样板)
+        Path("neo4j_browser_style.grass").write_text(basic_style, encoding="utf-8")
+
         print("✅ 基础样式文件已保存到: neo4j_browser_style.grass")
         
         return basic_style
@@ -562,6 +925,17 @@ def main():
     builder = TCMNeo4jBuilder()
     
     try:
+        # 0a. 冷库可选离线批量导入 (绕过Bolt，需要数据库已停止)
+        bulk = input("是否使用neo4j-admin离线批量导入？(需要数据库已停止，冷库初次构建用) (y/N): ").lower().strip()
+        if bulk == 'y':
+            entities_df = builder.load_entities()
+            relationships_df = builder.load_relationships()
+            if entities_df.empty or relationships_df.empty:
+                print("❌ 无法加载数据")
+                return
+            builder.bulk_import(entities_df, relationships_df)
+            return
+
         # 0. 列出可用数据库 (可选)
         show_databases = input("是否显示可用数据库列表？(y/N): ").lower().strip()
         if show_databases == 'y':
@@ -571,45 +945,58 @@ def main():
         if not builder.connect():
             return
         
-        # 2. 清空数据库 (可选)
+        # 2. 清空数据库 (可选)；3/4. 加载实体和关系数据。
+        #    服务端删除和本地parquet解析互不依赖: 清库放到后台线程，
+        #    与数据加载重叠进行 (约束/索引本来就推迟到导入完成后建)
         clear_db = input("是否清空现有数据库？(y/N): ").lower().strip()
-        if clear_db == 'y':
-            if not builder.clear_database():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            clear_future = (executor.submit(builder.clear_database)
+                            if clear_db == 'y' else None)
+
+            entities_df = builder.load_entities()
+            relationships_df = builder.load_relationships()
+
+            if clear_future is not None and not clear_future.result():
                 return
-        
-        # 3. 创建约束和索引
-        builder.create_constraints_and_indexes()
-        
-        # 4. 加载实体数据
-        entities_df = builder.load_entities()
+
         if entities_df.empty:
             print("❌ 无法加载实体数据")
             return
-        
-        # 5. 加载关系数据
-        relationships_df = builder.load_relationships()
         if relationships_df.empty:
             print("❌ 无法加载关系数据")
             return
-        
-        # 6. 创建实体节点
+
+        # 5. 创建实体节点 (先导数据，索引推迟建，导入期间零索引维护)；
+        #    关系的清洗和端点id解析是纯CPU工作，放到后台线程与
+        #    实体批次上送重叠进行
         start_time = time.time()
-        builder.create_entities(entities_df)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            prepared_future = executor.submit(builder.prepare_relationships,
+                                              relationships_df, entities_df)
+            builder.create_entities(entities_df)
+            prepared_relationships = prepared_future.result()
         entities_time = time.time() - start_time
-        
-        # 7. 创建关系
+
+        # 6. 关系MATCH依赖的id约束，在节点导入后一次性建好
+        builder.create_id_constraint()
+
+        # 7. 创建关系 (带实体表，端点按唯一id匹配)
         start_time = time.time()
-        builder.create_relationships(relationships_df)
+        builder.create_relationships(relationships_df, entities_df,
+                                     prepared=prepared_relationships)
         relationships_time = time.time() - start_time
-        
-        # 8. 获取并显示统计信息
+
+        # 8. 其余约束和索引在全部导入完成后创建
+        builder.create_constraints_and_indexes()
+
+        # 9. 获取并显示统计信息
         stats = builder.get_database_statistics()
         builder.print_statistics(stats)
         
-        # 9. 生成浏览器样式
+        # 10. 生成浏览器样式
         builder.generate_browser_style()
-        
-        # 10. 显示使用说明
+
+        # 11. 显示使用说明
         builder.print_usage_instructions()
         
         print(f"\n⏱️  构建时间:")
@@ -5,7 +5,9 @@
 """
 
 import pandas as pd
+import pyarrow.parquet as pq
 import os
+import sys
 
 def check_entities_parquet():
     """检查entities.parquet原始数据"""
@@ -18,8 +20,10 @@ def check_entities_parquet():
     print(f"📊 分析GraphRAG原始输出: {entities_file}")
     print("="*60)
     
-    # 读取数据
-    df = pd.read_parquet(entities_file)
+    # 读取数据 (只读分析用到的列，parquet列存下未选中的列不会解压)
+    wanted = ['id', 'title', 'type', 'description']
+    available = set(pq.read_schema(entities_file).names)
+    df = pd.read_parquet(entities_file, columns=[c for c in wanted if c in available])
     total_count = len(df)
     print(f"📈 总实体数量: {total_count:,}")
     
@@ -27,33 +31,39 @@ def check_entities_parquet():
     print(f"\n🏷️  type字段详细分析:")
     print("-" * 40)
     
+    # strip只做一次，四类计数全部从is_nan/stripped这两个
+    # 布尔/字符串列派生，不再对type列反复扫描
+    type_col = df['type']
+    is_nan = type_col.isna()
+    stripped = type_col.fillna('').astype(str).str.strip()
+
     # 1. NaN/NULL值
-    nan_count = df['type'].isna().sum()
+    nan_count = int(is_nan.sum())
     print(f"type为NaN/NULL的数量: {nan_count:,} ({nan_count/total_count*100:.2f}%)")
-    
+
     # 2. 空字符串
-    empty_string_count = len(df[df['type'] == ''])
+    empty_string_count = int((~is_nan & (type_col == '')).sum())
     print(f"type为空字符串('')的数量: {empty_string_count:,} ({empty_string_count/total_count*100:.2f}%)")
-    
-    # 3. 纯空格
-    whitespace_count = len(df[df['type'].str.strip() == '']) - empty_string_count
+
+    # 3. 纯空格 (strip后为空但原值非空)
+    whitespace_count = int((~is_nan & (stripped == '')).sum()) - empty_string_count
     print(f"type为纯空格的数量: {whitespace_count:,} ({whitespace_count/total_count*100:.2f}%)")
-    
+
     # 4. 有效值
-    valid_count = len(df[df['type'].notna() & (df['type'].str.strip() != '')])
+    valid_count = int((~is_nan & (stripped != '')).sum())
     print(f"type有有效值的数量: {valid_count:,} ({valid_count/total_count*100:.2f}%)")
     
     # 显示type值分布
     print(f"\n📊 原始数据中的type值分布:")
     print("-" * 50)
-    type_counts = df['type'].value_counts(dropna=False)
+    # 直接在清洗好的stripped列上做value_counts: 分布和上面的分类
+    # 口径一致，展示时也不用对每个值再strip一遍
+    type_counts = stripped.mask(is_nan).value_counts(dropna=False)
     for i, (type_val, count) in enumerate(type_counts.head(15).items(), 1):
         if pd.isna(type_val):
             type_display = "⚠️ NaN/NULL (这些会导致Neo4j中的空字符串!)"
         elif type_val == '':
-            type_display = "'' (空字符串)"
-        elif type_val.strip() == '':
-            type_display = f"'{type_val}' (纯空格)"
+            type_display = "'' (空字符串或纯空格)"
         else:
             type_display = f"'{type_val}'"
         print(f"{i:2d}. {type_display}: {count:,}")
@@ -62,11 +72,12 @@ def check_entities_parquet():
     if nan_count > 0:
         print(f"\n🔍 NaN type实体样例 (这些在Neo4j中会变成空字符串):")
         print("-" * 70)
-        nan_entities = df[df['type'].isna()].head(5)
-        for i, (idx, row) in enumerate(nan_entities.iterrows(), 1):
-            print(f"{i}. ID: {row.get('id', 'N/A')}")
-            print(f"   名称: {row.get('title', 'N/A')}")
-            desc = str(row.get('description', 'N/A'))
+        # itertuples避免iterrows为每行构造Series的装箱开销 (复用is_nan掩码)
+        nan_entities = df.loc[is_nan, ['id', 'title', 'description']].head(5)
+        for i, row in enumerate(nan_entities.itertuples(index=False), 1):
+            print(f"{i}. ID: {row.id}")
+            print(f"   名称: {row.title}")
+            desc = str(row.description)
             print(f"   描述: {desc[:80]}...")
             print()
     
@@ -79,22 +90,23 @@ def check_entities_parquet():
 
 def explain_neo4j_conversion():
     """解释Neo4j转换过程"""
-    print(f"\n🔄 Neo4j导入过程分析:")
-    print("="*60)
-    
-    print("在build_neo4j.py第211行的处理逻辑:")
-    print("```python")
-    print("entity_type = str(row.get('type', '')).strip().strip('\"') if pd.notna(row.get('type')) else ''")
-    print("```")
-    
-    print(f"\n💡 转换规则:")
-    print("✅ 如果原始type是有效值 → 保持不变")
-    print("⚠️  如果原始type是NaN/NULL → 转换为空字符串 ''")  
-    print("⚠️  如果原始type是空字符串 → 保持空字符串 ''")
-    print("⚠️  如果原始type是纯空格 → trim后变成空字符串 ''")
-    
-    print(f"\n🎯 结论:")
-    print("Neo4j中type为空字符串的实体 = GraphRAG原始输出中type为NaN的实体")
+    # 固定文案攒成一段，单次stdout写出，避免逐行print的写调用
+    lines = [
+        f"\n🔄 Neo4j导入过程分析:",
+        "="*60,
+        "在build_neo4j.py第211行的处理逻辑:",
+        "```python",
+        "entity_type = str(row.get('type', '')).strip().strip('\"') if pd.notna(row.get('type')) else ''",
+        "```",
+        f"\n💡 转换规则:",
+        "✅ 如果原始type是有效值 → 保持不变",
+        "⚠️  如果原始type是NaN/NULL → 转换为空字符串 ''",
+        "⚠️  如果原始type是空字符串 → 保持空字符串 ''",
+        "⚠️  如果原始type是纯空格 → trim后变成空字符串 ''",
+        f"\n🎯 结论:",
+        "Neo4j中type为空字符串的实体 = GraphRAG原始输出中type为NaN的实体",
+    ]
+    sys.stdout.write("\n".join(lines) + "\n")
 
 def main():
     """主函数"""
@@ -109,21 +121,25 @@ def main():
         # 解释转换过程
         explain_neo4j_conversion()
         
-        # 给出最终结论
-        print(f"\n📋 最终答案:")
-        print("="*60)
+        # 给出最终结论 (同样一次性写出)
+        lines = [f"\n📋 最终答案:", "="*60]
         if stats['nan_count'] > 0:
-            print(f"🎯 type为空字符串的原因: GraphRAG原始数据问题")
-            print(f"📊 原始entities.parquet中有{stats['nan_count']:,}个实体的type字段为NaN")
-            print(f"🔄 这些NaN在导入Neo4j时被转换为空字符串")
-            print(f"")
-            print(f"💡 这说明:")
-            print(f"   - GraphRAG的LLM在提取这些实体时没有分配类型")
-            print(f"   - 可能是实体类型不在预定义列表中")
-            print(f"   - 或者LLM无法确定这些实体的类型")
+            lines += [
+                f"🎯 type为空字符串的原因: GraphRAG原始数据问题",
+                f"📊 原始entities.parquet中有{stats['nan_count']:,}个实体的type字段为NaN",
+                f"🔄 这些NaN在导入Neo4j时被转换为空字符串",
+                f"",
+                f"💡 这说明:",
+                f"   - GraphRAG的LLM在提取这些实体时没有分配类型",
+                f"   - 可能是实体类型不在预定义列表中",
+                f"   - 或者LLM无法确定这些实体的类型",
+            ]
         else:
-            print(f"✅ 原始数据质量良好，所有实体都有type")
-            print(f"🔍 需要进一步检查Neo4j导入过程")
+            lines += [
+                f"✅ 原始数据质量良好，所有实体都有type",
+                f"🔍 需要进一步检查Neo4j导入过程",
+            ]
+        sys.stdout.write("\n".join(lines) + "\n")
 
 if __name__ == "__main__":
     try:
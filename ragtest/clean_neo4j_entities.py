@@ -3,55 +3,122 @@
 清洗Neo4j数据库中的非预定义实体节点
 """
 
-from neo4j import GraphDatabase
+import time
+from collections import Counter
+
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+
+from neo4j_driver import get_driver
 
 class Neo4jCleaner:
-    def __init__(self, uri="bolt://localhost:7687", user="neo4j", password="password"):
-        """初始化Neo4j连接"""
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
-        
-        # 预定义的中医实体类型
-        self.predefined_types = [
-            '药材', '方剂', '疾病', '症状', '医家', '功效', 
+    def __init__(self, uri="bolt://localhost:7687", user="neo4j", password="password",
+                 database="neo4j"):
+        """初始化Neo4j连接 (复用进程级共享driver及其连接池)"""
+        self.driver = get_driver(uri, user, password)
+        # 显式指定database，省掉每个session首次使用时的默认库解析round-trip
+        self.database = database
+        
+        # 预定义的中医实体类型 (只做成员判断，用frozenset)
+        self.predefined_types = frozenset({
+            '药材', '方剂', '疾病', '症状', '医家', '功效',
             '病因', '脉象', '诊断方法', '经络', '穴位', '脏腑'
-        ]
+        })
+
+        # 标签统计快照缓存: 一次聚合查询抓齐{count, connected, isolated}
+        # 供所有清洗前阶段复用，整个流程只在清洗前后各读一次
+        self._snapshot_cache = None
         
     def close(self):
-        """关闭连接"""
-        self.driver.close()
+        """释放引用 (共享driver由atexit统一关闭，这里不真正close)"""
+        self.driver = None
         
-    def run_query(self, query, parameters=None):
-        """执行Cypher查询"""
-        with self.driver.session() as session:
-            result = session.run(query, parameters or {})
+    def _session(self):
+        """为一个阶段开一个session
+
+        有多条查询的阶段应当整段复用同一个session: 每条查询都
+        新开session会反复经历连接领取和路由状态建立，把本该
+        流水化的阶段串行在session生命周期管理上。
+        """
+        return self.driver.session(database=self.database)
+
+    def run_query(self, query, parameters=None, session=None):
+        """执行Cypher只读查询 (传入session时在其上走托管读事务)"""
+        if session is not None:
+            return session.execute_read(lambda tx: list(tx.run(query, parameters or {})))
+        with self.driver.session(database=self.database) as s:
+            result = s.run(query, parameters or {})
             return list(result)
+
+    def run_delete(self, query, session=None, max_retries=3):
+        """执行删除语句，返回真正删除的节点数
+
+        删除数直接取写入摘要的counters，不用事后再发一条COUNT
+        重扫一遍来核对。CALL IN TRANSACTIONS要求auto-commit事务，
+        进不了execute_write的托管重试，所以自带指数退避重试:
+        并发负载下的死锁/瞬态错误自动重跑(删孤立节点是幂等的)，
+        不必留下残余节点等人工再跑一遍。
+        """
+        for attempt in range(max_retries):
+            try:
+                if session is not None:
+                    return session.run(query).consume().counters.nodes_deleted
+                with self.driver.session(database=self.database) as s:
+                    return s.run(query).consume().counters.nodes_deleted
+            except (TransientError, ServiceUnavailable, SessionExpired) as e:
+                if attempt == max_retries - 1:
+                    raise
+                wait = 2 ** attempt
+                print(f"   ⏳ 瞬态错误，{wait}秒后重试: {e}")
+                time.sleep(wait)
     
+    def _snapshot(self, refresh=False):
+        """一次聚合查询抓取所有标签的统计快照并缓存
+
+        返回 {label: {'count', 'connected', 'isolated'}}。统计、类型
+        分析、连接检查、清洗探测全部从这份快照取数——各阶段不再
+        自己发查询，整个run_full_cleaning只剩清洗前后各一次读取。
+        排序交给服务端，dict按插入序保留降序。
+        """
+        if self._snapshot_cache is None or refresh:
+            results = self.run_query("""
+            MATCH (n)
+            UNWIND labels(n) as label
+            WITH label, n,
+                 (CASE WHEN EXISTS { (n)--() } THEN 1 ELSE 0 END) as has_rel
+            RETURN label, count(*) as count, sum(has_rel) as connected
+            ORDER BY count DESC
+            """)
+            self._snapshot_cache = {
+                record['label']: {
+                    'count': record['count'],
+                    'connected': record['connected'],
+                    'isolated': record['count'] - record['connected'],
+                }
+                for record in results
+            }
+        return self._snapshot_cache
+
+    def get_label_counts(self, refresh=False):
+        """获取各标签的节点计数 (快照的纯视图)"""
+        return {label: info['count']
+                for label, info in self._snapshot(refresh).items()}
+
     def get_entity_statistics(self):
         """获取实体统计信息"""
         print("📊 清洗前实体统计")
         print("=" * 50)
-        
-        # 获取所有标签及其节点数量
-        labels = self.run_query("CALL db.labels() YIELD label RETURN label")
-        
-        label_counts = []
-        for record in labels:
-            label = record['label']
-            result = self.run_query(f"MATCH (n:`{label}`) RETURN count(n) as count")
-            count = result[0]['count']
-            label_counts.append({'label': label, 'count': count})
-        
-        # 按数量排序
-        label_counts.sort(key=lambda x: x['count'], reverse=True)
-        
-        total_nodes = sum(item['count'] for item in label_counts)
-        
+
+        # 聚合查询已按数量降序返回，直接迭代展示，
+        # 不再构造中间dict列表、也不在Python里再排一次
+        label_counts = self.get_label_counts()
+        total_nodes = sum(label_counts.values())
+
         print(f"总节点数: {total_nodes:,}")
         print("\n节点标签分布:")
-        for item in label_counts:
-            percentage = item['count'] / total_nodes * 100
-            print(f"  {item['label']:<20}: {item['count']:>8,} ({percentage:>5.1f}%)")
-        
+        for label, count in label_counts.items():
+            percentage = count / total_nodes * 100
+            print(f"  {label:<20}: {count:>8,} ({percentage:>5.1f}%)")
+
         return label_counts
     
     def analyze_entity_types(self):
@@ -59,27 +126,26 @@ class Neo4jCleaner:
         print("\n🔍 实体类型分析")
         print("=" * 50)
         
-        # 获取所有标签
-        labels = self.run_query("CALL db.labels() YIELD label RETURN label")
-        label_list = [record['label'] for record in labels]
-        
-        predefined_count = 0
-        unknown_count = 0
-        other_count = 0
-        
-        for label in label_list:
-            result = self.run_query(f"MATCH (n:`{label}`) RETURN count(n) as count")
-            count = result[0]['count']
-            
+        # 复用统计阶段缓存的标签计数(同一份聚合查询结果)，装进Counter后
+        # 分类求和与most_common排序都走C实现，不再对每个标签单独COUNT
+        counter = Counter(self.get_label_counts())
+
+        predefined_count = sum(counter[t] for t in self.predefined_types)
+        unknown = Counter({label: count for label, count in counter.items()
+                           if label.lower() == 'unknown'})
+        unknown_count = sum(unknown.values())
+        extras = Counter({label: count for label, count in counter.items()
+                          if label not in self.predefined_types and label not in unknown})
+        other_count = sum(extras.values())
+
+        # 预定义在前，其余按数量降序展示
+        for label, count in counter.most_common():
             if label in self.predefined_types:
-                predefined_count += count
                 print(f"✅ 预定义类型: {label:<15} - {count:>6,} 个节点")
-            elif label.lower() == 'unknown':
-                unknown_count += count
-                print(f"⏭️  Unknown类型: {label:<15} - {count:>6,} 个节点 (将跳过)")
-            else:
-                other_count += count
-                print(f"❓ 其他类型: {label:<15} - {count:>6,} 个节点 (需要检查)")
+        for label, count in unknown.most_common():
+            print(f"⏭️  Unknown类型: {label:<15} - {count:>6,} 个节点 (将跳过)")
+        for label, count in extras.most_common():
+            print(f"❓ 其他类型: {label:<15} - {count:>6,} 个节点 (需要检查)")
         
         print(f"\n📈 分类统计:")
         print(f"  预定义类型: {predefined_count:,} 个节点")
@@ -97,33 +163,19 @@ class Neo4jCleaner:
         print("\n🔗 检查非预定义实体连接情况")
         print("=" * 50)
         
-        # 获取所有标签
-        labels = self.run_query("CALL db.labels() YIELD label RETURN label")
-        label_list = [record['label'] for record in labels]
-        
+        # 直接格式化共享快照——连接统计已随快照一趟扫描拿到，
+        # 这里零查询 (原来每个标签两次round-trip，各自一次label scan)
         connected_entities = []
         isolated_entities = []
-        
-        for label in label_list:
+
+        for label, info in self._snapshot().items():
             if label in self.predefined_types or label.lower() == 'unknown':
                 continue
-                
-            # 检查该标签下的节点是否有关系连接
-            query = f"""
-            MATCH (n:`{label}`)
-            WHERE (n)--()
-            RETURN count(n) as connected_count
-            """
-            connected_result = self.run_query(query)
-            connected_count = connected_result[0]['connected_count']
-            
-            # 检查该标签下的总节点数
-            total_query = f"MATCH (n:`{label}`) RETURN count(n) as total_count"
-            total_result = self.run_query(total_query)
-            total_count = total_result[0]['total_count']
-            
-            isolated_count = total_count - connected_count
-            
+
+            total_count = info['count']
+            connected_count = info['connected']
+            isolated_count = info['isolated']
+
             if connected_count > 0:
                 connected_entities.append({
                     'label': label,
@@ -148,26 +200,16 @@ class Neo4jCleaner:
         print("\n🧹 开始清洗实体节点")
         print("=" * 50)
         
-        # 获取孤立的其他类型实体
-        labels = self.run_query("CALL db.labels() YIELD label RETURN label")
-        label_list = [record['label'] for record in labels]
-        
+        # 探测孤立的其他类型实体: 孤立计数已在共享快照里，
+        # 这里零查询，删除仍以写入摘要的实际计数为准
         nodes_to_delete = 0
         labels_to_process = []
-        
-        for label in label_list:
+
+        for label, info in self._snapshot().items():
             if label in self.predefined_types or label.lower() == 'unknown':
                 continue
-                
-            # 检查孤立节点
-            isolated_query = f"""
-            MATCH (n:`{label}`)
-            WHERE NOT (n)--()
-            RETURN count(n) as isolated_count
-            """
-            isolated_result = self.run_query(isolated_query)
-            isolated_count = isolated_result[0]['isolated_count']
-            
+
+            isolated_count = info['isolated']
             if isolated_count > 0:
                 labels_to_process.append({
                     'label': label,
@@ -187,25 +229,31 @@ class Neo4jCleaner:
             print("❌ 操作已取消")
             return
         
-        # 执行删除操作
+        # 执行删除操作: 每个标签恰好一条语句，CALL { } IN TRANSACTIONS
+        # 让服务端按1万行一个子事务分批提交 (与clear_neo4j的删除模式
+        # 一致)，不再先apoc试跑、失败再退回单事务的双路径
         deleted_count = 0
-        for item in labels_to_process:
-            label = item['label']
-            isolated_count = item['isolated_count']
-            
-            delete_query = f"""
-            MATCH (n:`{label}`)
-            WHERE NOT (n)--()
-            DELETE n
-            RETURN count(n) as deleted_count
-            """
-            
-            try:
-                result = self.run_query(delete_query)
-                deleted_count += isolated_count
-                print(f"✅ 已删除 {label} 标签下的 {isolated_count:,} 个孤立节点")
-            except Exception as e:
-                print(f"❌ 删除 {label} 标签节点时出错: {e}")
+        with self._session() as session:
+            for item in labels_to_process:
+                label = item['label']
+
+                # 删除保留逐标签的label scan形式: 参数化的
+                # `$label IN labels(n)`只有一个计划，但每个标签都要
+                # 全图扫描，得不偿失
+                delete_query = f"""
+                MATCH (n:`{label}`)
+                WHERE COUNT {{ (n)--() }} = 0
+                CALL {{ WITH n DELETE n }} IN TRANSACTIONS OF 10000 ROWS
+                """
+
+                try:
+                    # 以写入摘要的计数为准，而不是探测阶段的快照
+                    # (两个阶段之间图可能已被并发修改)
+                    deleted = self.run_delete(delete_query, session=session)
+                    deleted_count += deleted
+                    print(f"✅ 已删除 {label} 标签下的 {deleted:,} 个孤立节点")
+                except Exception as e:
+                    print(f"❌ 删除 {label} 标签节点时出错: {e}")
         
         print(f"\n✅ 清洗完成! 共删除 {deleted_count:,} 个孤立节点")
     
@@ -214,23 +262,15 @@ class Neo4jCleaner:
         print("\n🔍 验证清洗结果")
         print("=" * 50)
         
-        # 重新统计节点
-        labels = self.run_query("CALL db.labels() YIELD label RETURN label")
-        
-        total_nodes = 0
-        remaining_other_types = []
-        
-        for record in labels:
-            label = record['label']
-            result = self.run_query(f"MATCH (n:`{label}`) RETURN count(n) as count")
-            count = result[0]['count']
-            total_nodes += count
-            
-            if label not in self.predefined_types and label.lower() != 'unknown':
-                remaining_other_types.append({
-                    'label': label,
-                    'count': count
-                })
+        # 重新统计节点: 刷新缓存的聚合计数，一次round-trip覆盖全部标签
+        label_counts = self.get_label_counts(refresh=True)
+
+        total_nodes = sum(label_counts.values())
+        remaining_other_types = [
+            {'label': label, 'count': count}
+            for label, count in label_counts.items()
+            if label not in self.predefined_types and label.lower() != 'unknown'
+        ]
         
         print(f"清洗后总节点数: {total_nodes:,}")
         
@@ -4,11 +4,16 @@
 用于在导入GraphRAG数据之前清空现有数据
 """
 
-from neo4j import GraphDatabase
 import sys
 
-def clear_neo4j_database():
-    """清空Neo4j数据库中的所有数据"""
+from neo4j_driver import get_driver
+
+def clear_neo4j_database(verify=False):
+    """清空Neo4j数据库中的所有数据
+
+    verify=True时删除后重新计数核对一遍。默认关闭: 分批删除
+    要么全部成功要么抛异常，事后核对纯属多付一次全图扫描。
+    """
     
     # 连接配置
     NEO4J_URI = "neo4j://localhost"
@@ -34,16 +39,22 @@ def clear_neo4j_database():
         return False
     
     try:
-        # 连接数据库
+        # 连接数据库 (进程级共享driver，退出时由atexit统一关闭)
         print("\n🔌 连接到Neo4j...")
-        driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
-        
+        driver = get_driver(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)
+
         with driver.session(database=NEO4J_DATABASE) as session:
             
-            # 1. 检查数据库状态
-            node_count = session.run("MATCH (n) RETURN count(n) as count").single()["count"]
-            rel_count = session.run("MATCH ()-[r]->() RETURN count(r) as count").single()["count"]
-            
+            # 1. 检查数据库状态 (两个计数都走counts store，
+            #    用CALL子查询并进一条语句，一次round-trip拿齐)
+            record = session.run("""
+                CALL { MATCH (n) RETURN count(n) as node_count }
+                CALL { MATCH ()-[r]->() RETURN count(r) as rel_count }
+                RETURN node_count, rel_count
+            """).single()
+            node_count, rel_count = record["node_count"], record["rel_count"]
+
+
             print(f"📊 当前数据库状态:")
             print(f"   节点数: {node_count:,}")
             print(f"   关系数: {rel_count:,}")
@@ -60,44 +71,59 @@ def clear_neo4j_database():
             """)
             print("✅ 所有节点和关系已删除")
             
-            # 3. 删除约束
-            print("\n🗑️  删除所有约束...")
+            # 3/4. 删除约束和索引: apoc.schema.assert({}, {})一次调用
+            #      把全部约束和索引(LOOKUP除外)清掉——K个schema对象
+            #      只花一个Bolt round-trip，而不是K次DROP
+            print("\n🗑️  删除所有约束和索引...")
             try:
-                constraints_result = session.run("SHOW CONSTRAINTS")
-                constraints = [record["name"] for record in constraints_result]
-                
-                for constraint_name in constraints:
-                    try:
-                        session.run(f"DROP CONSTRAINT {constraint_name}")
-                        print(f"   ✅ 删除约束: {constraint_name}")
-                    except Exception as e:
-                        print(f"   ⚠️  无法删除约束 {constraint_name}: {e}")
-                        
-            except Exception as e:
-                print(f"   ⚠️  获取约束列表失败: {e}")
-            
-            # 4. 删除索引
-            print("\n🗑️  删除所有索引...")
-            try:
-                indexes_result = session.run("SHOW INDEXES")
-                indexes = [(record["name"], record["type"]) for record in indexes_result]
-                
-                for index_name, index_type in indexes:
-                    if index_type != 'LOOKUP':  # 保留系统索引
+                session.run("CALL apoc.schema.assert({}, {})").consume()
+                print("   ✅ 约束和索引已全部删除")
+            except Exception:
+                # APOC不可用时退回SHOW+逐条DROP
+                try:
+                    constraints_result = session.run("SHOW CONSTRAINTS")
+                    constraints = [record["name"] for record in constraints_result]
+
+                    for constraint_name in constraints:
                         try:
-                            session.run(f"DROP INDEX {index_name}")
-                            print(f"   ✅ 删除索引: {index_name}")
+                            session.run(f"DROP CONSTRAINT {constraint_name}")
+                            print(f"   ✅ 删除约束: {constraint_name}")
                         except Exception as e:
-                            print(f"   ⚠️  无法删除索引 {index_name}: {e}")
-                            
-            except Exception as e:
-                print(f"   ⚠️  获取索引列表失败: {e}")
+                            print(f"   ⚠️  无法删除约束 {constraint_name}: {e}")
+
+                except Exception as e:
+                    print(f"   ⚠️  获取约束列表失败: {e}")
+
+                try:
+                    indexes_result = session.run("SHOW INDEXES")
+                    indexes = [(record["name"], record["type"]) for record in indexes_result]
+
+                    for index_name, index_type in indexes:
+                        if index_type != 'LOOKUP':  # 保留系统索引
+                            try:
+                                session.run(f"DROP INDEX {index_name}")
+                                print(f"   ✅ 删除索引: {index_name}")
+                            except Exception as e:
+                                print(f"   ⚠️  无法删除索引 {index_name}: {e}")
+
+                except Exception as e:
+                    print(f"   ⚠️  获取索引列表失败: {e}")
             
-            # 5. 验证清空结果
+            # 5. 验证清空结果 (可选，同样一条语句拿齐两个计数)
+            if not verify:
+                print("\n🎉 数据库已完全清空!")
+                print("✅ 现在可以安全导入GraphRAG数据了")
+                return True
+
             print("\n📊 验证清空结果...")
-            final_node_count = session.run("MATCH (n) RETURN count(n) as count").single()["count"]
-            final_rel_count = session.run("MATCH ()-[r]->() RETURN count(r) as count").single()["count"]
-            
+            record = session.run("""
+                CALL { MATCH (n) RETURN count(n) as node_count }
+                CALL { MATCH ()-[r]->() RETURN count(r) as rel_count }
+                RETURN node_count, rel_count
+            """).single()
+            final_node_count, final_rel_count = record["node_count"], record["rel_count"]
+
+
             print(f"   节点数: {final_node_count}")
             print(f"   关系数: {final_rel_count}")
             
@@ -108,9 +134,7 @@ def clear_neo4j_database():
             else:
                 print("\n⚠️  清空可能不完整，请检查数据库状态")
                 return False
-                
-        driver.close()
-        
+
     except Exception as e:
         print(f"\n❌ 清空数据库失败: {e}")
         print("\n💡 请检查:")
@@ -121,7 +145,7 @@ def clear_neo4j_database():
 
 def main():
     """主函数"""
-    success = clear_neo4j_database()
+    success = clear_neo4j_database(verify='--verify' in sys.argv)
     
     if success:
         print("\n🚀 下一步：运行Neo4j导入")
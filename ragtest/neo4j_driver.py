@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+进程级共享的Neo4j driver
+
+driver内部自带连接池，应当每个进程建一次、所有调用方复用；
+各脚本入口各自建driver、用完就关，等于每次都丢掉连接池、
+重付一遍TLS+Bolt握手(约百毫秒量级)。这里按(uri, user)缓存
+driver，由atexit在进程退出时统一关闭，调用方不要自己close。
+"""
+
+import atexit
+import os
+
+from neo4j import GraphDatabase
+
+_DRIVERS = {}
+
+def _env_int(name, default):
+    """读取整数环境变量，未设置或非法时用默认值"""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+def get_driver(uri="bolt://localhost:7687", user="neo4j", password="password"):
+    """按(uri, user)懒初始化并缓存driver
+
+    池参数按单客户端批处理脚本定型(可用环境变量覆盖):
+    默认池(100连接)对一个客户端是浪费，而60秒的连接领取超时
+    会把真实的服务端拥塞藏成静默排队——小池子加短超时让过载
+    立刻暴露出来，吞吐也更可预测。
+    """
+    key = (uri, user)
+    driver = _DRIVERS.get(key)
+    if driver is None:
+        driver = GraphDatabase.driver(
+            uri, auth=(user, password),
+            max_connection_pool_size=_env_int('NEO4J_POOL_SIZE', 8),
+            connection_acquisition_timeout=_env_int('NEO4J_ACQ_TIMEOUT', 5),
+            connection_timeout=_env_int('NEO4J_CONN_TIMEOUT', 5),
+            max_transaction_retry_time=_env_int('NEO4J_RETRY_TIME', 15),
+        )
+        _DRIVERS[key] = driver
+        atexit.register(driver.close)
+    return driver
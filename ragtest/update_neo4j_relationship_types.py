@@ -4,133 +4,262 @@
 从description中提取括号内的内容作为新的关系类型
 """
 
-from neo4j import GraphDatabase
+import asyncio
+from neo4j import AsyncGraphDatabase
 import re
+import sys
+from collections import defaultdict
+
+# 每批UNWIND改写的关系数: 一个事务摊薄N次网络往返和提交开销
+_RETYPE_BATCH_SIZE = 1000
+
+# 同时在途的改写事务数: 客户端都在等Bolt应答(I/O bound)，
+# 服务端对互不相干的关系写入可以并行
+_MAX_CONCURRENT_BATCHES = 8
+
+# 方括号提取的正则预编译一次，热循环里不再走re模块缓存查找
+_BRACKET_RE = re.compile(r'\[([^\]]+)\]')
+
+# 每处理N条关系打一行进度: 行缓冲的print每条都要一次系统调用，
+# 大图上逐条打印的I/O开销能盖过Neo4j本身
+_PROGRESS_EVERY = 500
 
 class Neo4jRelationshipUpdater:
     def __init__(self, uri="bolt://localhost:7687", user="neo4j", password="password"):
-        """初始化Neo4j连接"""
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
-        
-    def close(self):
+        """初始化Neo4j连接 (异步driver，改写批次可以并发在途)"""
+        self.driver = AsyncGraphDatabase.driver(uri, auth=(user, password))
+        self._apoc_available = None
+
+    async def close(self):
         """关闭连接"""
-        self.driver.close()
-        
-    def run_query(self, query, parameters=None):
+        await self.driver.close()
+
+    async def run_query(self, query, parameters=None):
         """执行Cypher查询"""
-        with self.driver.session() as session:
-            result = session.run(query, parameters or {})
-            return list(result)
-    
-    def get_all_relationships(self):
-        """获取所有关系及其描述"""
-        print("🔍 获取所有关系...")
-        
+        async with self.driver.session() as session:
+            result = await session.run(query, parameters or {})
+            return [record async for record in result]
+
+    async def iter_query(self, query, parameters=None):
+        """流式执行Cypher查询，逐条yield记录
+
+        不把整个结果集list()进内存: 大图上全量关系的Record列表
+        先占O(E)内存才能开始干活，流式则边拉边处理，内存恒定，
+        客户端处理还能和服务端取数重叠。
+        """
+        async with self.driver.session() as session:
+            result = await session.run(query, parameters or {})
+            async for record in result:
+                yield record
+
+    async def iter_retype_candidates(self):
+        """流式产出(rel_id, 当前类型, 新类型)三元组
+
+        过滤下推到服务端: 没有方括号的描述不可能产生新类型，
+        在存储层就被筛掉，不再把全量边运过Bolt再在Python里丢弃。
+        APOC可用时提取也在服务端做(apoc.text.regexGroups)，Python
+        只负责按类型分组派发批次；否则退回客户端正则提取。
+        """
+        if await self._check_apoc():
+            print("🔍 流式获取关系 (服务端提取方括号类型)...")
+
+            # 正则以参数传入: 查询文本里写反斜杠要依赖Neo4j对非法
+            # 转义序列的宽容处理(已标记废弃)，参数化还让服务端和
+            # 退回路径共用同一个_BRACKET_RE模式
+            query = """
+            MATCH ()-[r]->()
+            WHERE r.description IS NOT NULL AND r.description CONTAINS '['
+            WITH r, apoc.text.regexGroups(r.description, $re) as g
+            WHERE size(g) > 0 AND trim(g[0][1]) <> ''
+            RETURN id(r) as rel_id, type(r) as rel_type, trim(g[0][1]) as new_type
+            """
+
+            async for rec in self.iter_query(query, {"re": _BRACKET_RE.pattern}):
+                yield rec['rel_id'], rec['rel_type'], rec['new_type']
+            return
+
+        print("🔍 流式获取含方括号描述的关系...")
+
         query = """
         MATCH ()-[r]->()
+        WHERE r.description IS NOT NULL AND r.description CONTAINS '['
         RETURN id(r) as rel_id, type(r) as rel_type, r.description as description
         """
-        
-        results = self.run_query(query)
-        print(f"✅ 找到 {len(results):,} 条关系")
-        
-        return results
+
+        async for rec in self.iter_query(query):
+            new_type = self.extract_relationship_type_from_description(rec['description'] or '')
+            if new_type:
+                yield rec['rel_id'], rec['rel_type'], new_type
     
     def extract_relationship_type_from_description(self, description):
         """从描述中提取关系类型"""
-        if not description:
+        # '[' in s是C级memchr，先挡掉多数无括号的描述，
+        # 省下正则引擎的启动开销
+        if not description or '[' not in description:
             return None
-            
-        # 查找方括号内的内容
-        bracket_pattern = r'\[([^\]]+)\]'
-        matches = re.findall(bracket_pattern, description)
-        
-        if matches:
-            return matches[0].strip()
-        return None
+
+        # search只取第一个方括号就停，不像findall把全文扫完再建列表
+        m = _BRACKET_RE.search(description)
+        return m.group(1).strip() if m else None
     
-    def update_relationship_type(self, rel_id, new_type):
-        """更新关系类型"""
-        # 先删除旧关系，再创建新关系
-        # 注意：Neo4j不允许参数化关系类型，需要使用字符串拼接
+    async def _check_apoc(self):
+        """探测APOC是否可用 (只探测一次并缓存结果)"""
+        if self._apoc_available is None:
+            try:
+                await self.run_query("RETURN apoc.version()")
+                self._apoc_available = True
+            except Exception:
+                self._apoc_available = False
+                print("⚠️  APOC不可用，改用DELETE+CREATE方式改写类型")
+        return self._apoc_available
+
+    async def retype_relationships(self, rel_ids, new_type):
+        """把一批关系改写为同一个新类型，返回实际改写条数
+
+        首选apoc.refactor.setType: 一次操作完成改类型，不手动
+        DELETE+CREATE复制属性(写入量减半)，且类型可以作为参数
+        传入，顺带消除了f-string拼接类型名的注入面。id列表
+        UNWIND成参数，一个托管写事务改写整批，而不是每条关系
+        一次网络往返加一个独立事务。
+        """
+        if await self._check_apoc():
+            query = """
+            UNWIND $ids AS rid
+            MATCH ()-[r]->()
+            WHERE id(r) = rid
+            CALL apoc.refactor.setType(r, $newType) YIELD output
+            RETURN count(output) as n
+            """
+
+            async def work(tx):
+                result = await tx.run(query, {"ids": rel_ids, "newType": new_type})
+                record = await result.single()
+                return record["n"]
+
+            async with self.driver.session() as session:
+                return await session.execute_write(work)
+
+        # 退回路径: Neo4j原生Cypher不允许参数化关系类型，
+        # 类型只能走字符串拼接
         query = f"""
+        UNWIND $ids AS rid
         MATCH (a)-[r]->(b)
-        WHERE id(r) = {rel_id}
+        WHERE id(r) = rid
         WITH a, b, r, properties(r) as props
         DELETE r
         CREATE (a)-[r2:`{new_type}`]->(b)
         SET r2 = props
-        RETURN r2
         """
-        
-        try:
-            result = self.run_query(query)
-            return True
-        except Exception as e:
-            print(f"❌ 更新关系 {rel_id} 失败: {e}")
-            return False
-    
-    def process_relationships(self):
+
+        async def work(tx):
+            result = await tx.run(query, {"ids": rel_ids})
+            summary = await result.consume()
+            return summary.counters.relationships_created
+
+        async with self.driver.session() as session:
+            return await session.execute_write(work)
+
+    async def _flush_retype_groups(self, groups):
+        """把累积的(新类型 -> id列表)分组并发写入，返回(成功, 失败)条数
+
+        各分组互不相干，asyncio.gather把它们的写事务同时挂在途
+        (上限_MAX_CONCURRENT_BATCHES)；偶发的锁冲突由execute_write
+        的托管重试兜底。
+        """
+        semaphore = asyncio.Semaphore(_MAX_CONCURRENT_BATCHES)
+
+        async def retype_one(new_type, rel_ids):
+            async with semaphore:
+                try:
+                    n = await self.retype_relationships(rel_ids, new_type)
+                    print(f"✅ {new_type}: 批量更新 {n:,} 条")
+                    return new_type, n, 0
+                except Exception as e:
+                    print(f"❌ {new_type}: 批量更新失败 ({len(rel_ids):,} 条): {e}")
+                    return new_type, 0, len(rel_ids)
+
+        results = await asyncio.gather(
+            *(retype_one(new_type, rel_ids) for new_type, rel_ids in groups.items()))
+
+        updated = 0
+        errors = 0
+        for _, n, failed in results:
+            updated += n
+            errors += failed
+
+        groups.clear()
+        return updated, errors
+
+    async def process_relationships(self):
         """处理所有关系"""
         print("🔄 开始处理关系类型...")
         print("=" * 50)
-        
-        # 获取所有关系
-        relationships = self.get_all_relationships()
-        
+
         updated_count = 0
         skipped_count = 0
         error_count = 0
-        
-        for rel in relationships:
-            rel_id = rel['rel_id']
-            current_type = rel['rel_type']
-            description = rel.get('description', '')
-            
-            # 提取新的关系类型
-            new_type = self.extract_relationship_type_from_description(description)
-            
-            if new_type:
-                print(f"🔄 更新: {current_type} -> {new_type}")
-                print(f"   描述: {description[:50]}...")
-                
-                if self.update_relationship_type(rel_id, new_type):
-                    updated_count += 1
-                    print(f"   ✅ 成功更新")
-                else:
-                    error_count += 1
-                    print(f"   ❌ 更新失败")
+
+        # 滚动窗口: 边流式提取边按目标类型分组，攒满一批就写入
+        # 清空，内存占用与批大小成正比而不是与全图关系数成正比
+        groups = defaultdict(list)
+        pending = 0
+
+        # 逐条的更新/跳过明细不再打印(各项计数照常累计，结尾统一
+        # 汇总)，只每_PROGRESS_EVERY条写一行滚动进度
+        processed = 0
+
+        # 候选流已带提取好的新类型 (类型已正确的不再重写，也避免
+        # 流式读取期间刚改写的新关系被重复处理)
+        async for rel_id, current_type, new_type in self.iter_retype_candidates():
+            if new_type != current_type:
+                groups[new_type].append(rel_id)
+                pending += 1
+
+                if pending >= _RETYPE_BATCH_SIZE:
+                    updated, errors = await self._flush_retype_groups(groups)
+                    updated_count += updated
+                    error_count += errors
+                    pending = 0
             else:
                 skipped_count += 1
-                print(f"⏭️  跳过: {current_type} (无括号内容)")
-        
+
+            processed += 1
+            if processed % _PROGRESS_EVERY == 0:
+                sys.stdout.write(f"⏩ 已处理 {processed:,} 条关系...\n")
+
+        # 收尾: 不足一批的残余
+        if pending:
+            updated, errors = await self._flush_retype_groups(groups)
+            updated_count += updated
+            error_count += errors
+
         print(f"\n📊 处理结果:")
         print("=" * 50)
         print(f"✅ 成功更新: {updated_count:,} 条关系")
-        print(f"⏭️  跳过处理: {skipped_count:,} 条关系")
+        print(f"⏭️  跳过处理: {skipped_count:,} 条关系 (无新类型或类型已正确)")
         print(f"❌ 更新失败: {error_count:,} 条关系")
         
         return updated_count, skipped_count, error_count
     
-    def verify_updates(self):
+    async def verify_updates(self):
         """验证更新结果"""
         print("\n🔍 验证更新结果...")
         print("=" * 50)
         
-        # 获取更新后的关系类型分布
+        # 类型分布必须回数据库聚合一次: CONTAINS '['下推后处理循环
+        # 只见过带方括号的关系，客户端累计覆盖不了全图；这一步本来
+        # 就是验证，一次聚合round-trip以库内实际状态为准
         query = """
         MATCH ()-[r]->()
         RETURN type(r) as rel_type, count(r) as count
         ORDER BY count DESC
         """
-        
-        results = self.run_query(query)
-        
+
+        results = await self.run_query(query)
+
         print("关系类型分布:")
         for result in results:
-            rel_type = result['rel_type']
-            count = result['count']
-            print(f"  {rel_type:<20}: {count:>6,}")
+            print(f"  {result['rel_type']:<20}: {result['count']:>6,}")
         
         # 检查是否还有RELATED_TO类型
         related_to_query = """
@@ -138,7 +267,7 @@ class Neo4jRelationshipUpdater:
         RETURN count(r) as count
         """
         
-        related_to_result = self.run_query(related_to_query)
+        related_to_result = await self.run_query(related_to_query)
         related_to_count = related_to_result[0]['count']
         
         if related_to_count > 0:
@@ -146,17 +275,17 @@ class Neo4jRelationshipUpdater:
         else:
             print(f"\n✅ 所有RELATED_TO关系已更新完成")
     
-    def run_full_update(self):
+    async def run_full_update(self):
         """运行完整更新流程"""
         print("🔄 Neo4j关系类型更新工具")
         print("=" * 60)
-        
+
         try:
             # 处理关系
-            updated, skipped, errors = self.process_relationships()
-            
+            updated, skipped, errors = await self.process_relationships()
+
             # 验证结果
-            self.verify_updates()
+            await self.verify_updates()
             
             print(f"\n✅ 更新完成!")
             print(f"📝 总结:")
@@ -167,7 +296,7 @@ class Neo4jRelationshipUpdater:
         except Exception as e:
             print(f"❌ 更新过程中出现错误: {e}")
         finally:
-            self.close()
+            await self.close()
 
 def main():
     """主函数"""
@@ -180,8 +309,8 @@ def main():
     
     try:
         updater = Neo4jRelationshipUpdater()
-        updater.run_full_update()
-        
+        asyncio.run(updater.run_full_update())
+
     except Exception as e:
         print(f"❌ 连接失败: {e}")
         print("请检查Neo4j服务是否运行")